@@ -1,9 +1,15 @@
-from flask import Flask, render_template, request, jsonify, send_file, Response
-from universal_downloader import UniversalDownloader
+from flask import Flask, render_template, request, jsonify, send_file, Response, g
+from universal_downloader import get_downloader
+from rate_limiter import UpstreamUnavailable
+from deadline import Deadline, DeadlineExceeded, RequestCancelled, socket_disconnect_check
+import profiler
+from collections import deque
 import os
+import math
 import time
 import json
 import re
+import hmac
 import requests
 
 app = Flask(__name__)
@@ -14,8 +20,80 @@ DOWNLOAD_DIR = 'downloads'
 if not os.path.exists(DOWNLOAD_DIR):
     os.makedirs(DOWNLOAD_DIR)
 
-# 创建通用下载器实例
-downloader = UniversalDownloader(DOWNLOAD_DIR)
+# 请求预算（秒），客户端可通过 X-Request-Timeout 请求头进一步缩短
+PARSE_TIMEOUT = float(os.environ.get('PARSE_TIMEOUT', 30))
+DOWNLOAD_TIMEOUT = float(os.environ.get('DOWNLOAD_TIMEOUT', 300))
+PROXY_IMAGE_TIMEOUT = float(os.environ.get('PROXY_IMAGE_TIMEOUT', 10))
+
+# 管理接口令牌，未设置时管理接口和 X-Profile 请求头均不可用
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# 每个接口保留最近 N 次请求耗时，用于计算延迟分位数
+LATENCY_WINDOW = 1000
+request_latencies = {}
+
+# 通用下载器共享实例（yt-dlp 等后端在第一次使用时才导入）
+downloader = get_downloader(DOWNLOAD_DIR)
+
+def request_deadline(budget):
+    """为当前请求创建截止时间，并绑定客户端断开检测"""
+    client_budget = request.headers.get('X-Request-Timeout', type=float)
+    if client_budget and client_budget > 0:
+        budget = min(budget, client_budget)
+    # 从请求开始时计算，扣除排队和读取请求体的耗时
+    budget -= time.monotonic() - g.get('request_started', time.monotonic())
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    return Deadline(budget, socket_disconnect_check(sock))
+
+def is_admin():
+    """校验 X-Admin-Token 请求头"""
+    # 常数时间比较，避免通过响应耗时逐字节猜出令牌
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+@app.before_request
+def start_timer():
+    g.request_started = time.monotonic()
+    if request.path.startswith('/api/admin/'):
+        return
+    # X-Profile: sample / cprofile 强制剖析当前请求（需要管理员令牌）
+    forced_mode = request.headers.get('X-Profile') if is_admin() else None
+    g.profile = profiler.start_request(request.method, request.path, forced_mode)
+
+@app.after_request
+def record_latency(response):
+    if request.endpoint and 'request_started' in g:
+        latencies = request_latencies.setdefault(request.endpoint, deque(maxlen=LATENCY_WINDOW))
+        latencies.append(time.monotonic() - g.request_started)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.finish_request(profile, response.status_code)
+        response.headers['X-Profile-Id'] = str(profile.id)
+    return response
+
+def latency_percentiles():
+    """各接口最近请求的延迟分位数（毫秒）"""
+    result = {}
+    for endpoint, latencies in list(request_latencies.items()):
+        samples = sorted(latencies)
+        if not samples:
+            continue
+        pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+        result[endpoint] = {
+            'count': len(samples),
+            'p50': pick(0.50),
+            'p95': pick(0.95),
+            'p99': pick(0.99),
+            'max': round(samples[-1] * 1000, 1),
+        }
+    return result
+
+@app.teardown_request
+def finish_profile(exc):
+    # 未经 after_request 的异常请求也要结束剖析
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.finish_request(profile, 500)
 
 @app.route('/')
 def index():
@@ -42,10 +120,25 @@ def parse_url():
         platform_key, platform_name = downloader.detect_platform(share_url)
         print(f"检测到 {platform_name} 链接")
         
+        # 默认快速解析（只返回卡片信息），tier=full 时解析完整格式
+        tier = data.get('tier', 'fast')
+        if tier not in ('fast', 'full'):
+            return jsonify({'error': 'tier 只能是 fast 或 full'}), 400
+        
         # 处理链接
-        result = downloader.process_url(share_url)
+        result = downloader.process_url(share_url, request_deadline(PARSE_TIMEOUT), tier)
         
         if not result.get('success'):
+            error_code = result.get('error_code')
+            if error_code == 'upstream_unavailable':
+                # 平台熔断中，快速失败
+                return jsonify(result), 503, {'Retry-After': str(result.get('retry_after', 1))}
+            elif error_code == 'upstream_timeout':
+                return jsonify(result), 504
+            elif error_code == 'rate_limited':
+                return jsonify(result), 429
+            elif error_code == 'cancelled':
+                return jsonify(result), 499
             return jsonify(result), 400
         
         return jsonify(result)
@@ -71,7 +164,7 @@ def download_video():
         filepath = os.path.join(DOWNLOAD_DIR, filename)
         
         # 使用原始 URL 下载（避免 CDN 403 问题）
-        downloaded_file = downloader.download_video(original_url, filepath)
+        downloaded_file = downloader.download_video(original_url, filepath, request_deadline(DOWNLOAD_TIMEOUT))
         
         if not downloaded_file:
             return jsonify({'error': '下载失败，请稍后重试'}), 500
@@ -83,9 +176,46 @@ def download_video():
             'download_url': f'/download/{downloaded_file}'
         })
         
+    except UpstreamUnavailable as e:
+        retry_after = max(1, math.ceil(e.retry_after))
+        return jsonify({
+            'error': f'该平台当前访问受限，请 {retry_after} 秒后重试',
+            'error_code': 'upstream_unavailable',
+            'retry_after': retry_after,
+        }), 503, {'Retry-After': str(retry_after)}
+    except DeadlineExceeded:
+        return jsonify({'error': '下载超时，请稍后重试', 'error_code': 'upstream_timeout'}), 504
+    except RequestCancelled:
+        return jsonify({'error': '请求已取消', 'error_code': 'cancelled'}), 499
     except Exception as e:
         return jsonify({'error': f'下载错误: {str(e)}'}), 500
 
+@app.route('/api/metrics')
+def get_metrics():
+    """获取各平台限流器 / 熔断器状态、缓存统计及接口延迟分位数"""
+    metrics = downloader.get_metrics()
+    metrics['latency'] = latency_percentiles()
+    return jsonify(metrics)
+
+@app.route('/api/admin/slow-requests', methods=['GET', 'DELETE'])
+def slow_requests():
+    """最慢请求列表及阶段耗时；?format=collapsed 导出火焰图使用的 collapsed stacks"""
+    if not is_admin():
+        return jsonify({'error': '无权访问'}), 403
+    
+    if request.method == 'DELETE':
+        profiler.slow_requests.clear()
+        return jsonify({'success': True})
+    
+    profiles = profiler.slow_requests.items()
+    profile_id = request.args.get('id', type=int)
+    if profile_id is not None:
+        profiles = [p for p in profiles if p.id == profile_id]
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed_stacks(profiles), mimetype='text/plain')
+    return jsonify({'requests': [p.to_dict() for p in profiles]})
+
 @app.route('/download/<filename>')
 def serve_file(filename):
     """提供文件下载服务"""
@@ -131,14 +261,32 @@ def proxy_image():
             'Referer': 'https://www.instagram.com/',
         }
         
-        resp = requests.get(image_url, headers=headers, timeout=10, stream=True)
+        deadline = request_deadline(PROXY_IMAGE_TIMEOUT)
+        
+        def fetch():
+            resp = requests.get(image_url, headers=headers, timeout=deadline.timeout(), stream=True)
+            chunks = []
+            with resp:
+                if resp.status_code == 200:
+                    for chunk in resp.iter_content(chunk_size=16384):
+                        # requests 的 timeout 只限制单次读取，逐块检查总预算
+                        deadline.check()
+                        chunks.append(chunk)
+            return resp, b''.join(chunks)
+        
+        # 上游逐字节慢速返回时单个块可能一直读不完，在后台线程中执行，最多等待剩余预算
+        resp, content = deadline.call(profiler.traced('proxy_fetch', fetch))
         
         if resp.status_code == 200:
             content_type = resp.headers.get('Content-Type', 'image/jpeg')
-            return Response(resp.content, mimetype=content_type)
+            return Response(content, mimetype=content_type)
         else:
             return jsonify({'error': '无法获取图片'}), resp.status_code
             
+    except (DeadlineExceeded, requests.Timeout):
+        return jsonify({'error': '获取图片超时'}), 504
+    except RequestCancelled:
+        return jsonify({'error': '请求已取消', 'error_code': 'cancelled'}), 499
     except Exception as e:
         print(f"代理图片错误: {e}")
         return jsonify({'error': str(e)}), 500
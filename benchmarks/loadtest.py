@@ -0,0 +1,489 @@
+"""
+压测工具 - 比较不同 gunicorn worker 模型下的表现
+
+在本地启动一个模拟上游（视频 / 图片 / 带 og 标签的网页），然后分别用 sync、gthread、gevent、ASGI(uvicorn)
+等 worker 模型启动 app.py，按 parse / page / download / proxy-image 的混合流量回放请求，
+输出吞吐量、延迟分位数、每个 worker 的内存占用和失败率对比报告
+
+用法:
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --models sync,gthread --workers 2 --concurrency 32 --duration 30
+    python benchmarks/loadtest.py --upstream-latency 500 --mix parse=3,page=2,proxy=4,download=1 --json report.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 应用在临时目录中运行，需显式指定仓库中的 gunicorn 配置（preload + 预热 + gc.freeze）
+GUNICORN_CONFIG = os.path.join(REPO_DIR, 'gunicorn.conf.py')
+
+# 各 worker 模型的启动命令，{bind} {workers} {threads} 在运行时替换
+WORKER_MODELS = {
+    'sync': {
+        'requires': 'gunicorn',
+        'cmd': ['gunicorn', '--config', '{config}', '--bind', '{bind}', '--workers', '{workers}', 'app:app'],
+    },
+    'gthread': {
+        'requires': 'gunicorn',
+        'cmd': ['gunicorn', '--config', '{config}', '--bind', '{bind}', '--workers', '{workers}',
+                '--worker-class', 'gthread', '--threads', '{threads}', 'app:app'],
+    },
+    'gevent': {
+        'requires': 'gevent',
+        'cmd': ['gunicorn', '--config', '{config}', '--bind', '{bind}', '--workers', '{workers}',
+                '--worker-class', 'gevent', '--worker-connections', '{connections}', 'app:app'],
+    },
+    'asgi': {
+        # uvicorn 以 WSGI 接口运行 Flask 应用（请求在线程池中执行）
+        'requires': 'uvicorn',
+        'cmd': ['uvicorn', '--host', '{host}', '--port', '{port}', '--workers', '{workers}',
+                '--interface', 'wsgi', '--log-level', 'warning', 'app:app'],
+    },
+}
+
+# parse: 解析视频直链（走 yt-dlp）；page: 解析带 og/meta 标签的网页（走快速解析的 meta 层）
+DEFAULT_MIX = 'parse=3,page=3,proxy=3,download=1'
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<title>loadtest video {id}</title>
+<meta property="og:title" content="压测视频 {id} &amp; 示例">
+<meta property="og:image" content="{base}/image/{id}.jpg">
+<meta property="og:video:duration" content="{duration}">
+<meta name="author" content="loadtest">
+</head><body><video src="{base}/video/{id}.mp4"></video></body></html>
+"""
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """
+    模拟上游平台，均带可配置延迟：
+    /video/<id>.mp4 返回视频，/image/<id>.jpg 返回图片，/page/<id>.html 返回带 og/meta 标签的视频页面
+    """
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.2
+    video_bytes = b''
+    image_bytes = b''
+
+    def _serve(self, send_body: bool) -> None:
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.path.startswith('/video/'):
+            body, content_type = self.video_bytes, 'video/mp4'
+        elif self.path.startswith('/image/'):
+            body, content_type = self.image_bytes, 'image/jpeg'
+        elif self.path.startswith('/page/'):
+            page_id = self.path[len('/page/'):].split('.', 1)[0]
+            base = f'http://{self.headers.get("Host", "127.0.0.1")}'
+            body = PAGE_TEMPLATE.format(id=page_id, base=base, duration=60 + len(page_id)).encode()
+            content_type = 'text/html; charset=utf-8'
+        else:
+            body, content_type = b'not found', 'text/plain'
+            self.send_response(404)
+        if content_type != 'text/plain':
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self._serve(True)
+
+    def do_HEAD(self) -> None:
+        self._serve(False)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class UpstreamServer(ThreadingHTTPServer):
+    """客户端中途断开（请求超时、压测结束）时不打印异常栈，避免混入对比报告"""
+
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_upstream(latency: float, video_kb: int) -> ThreadingHTTPServer:
+    """在随机端口启动模拟上游"""
+    UpstreamHandler.latency = latency
+    UpstreamHandler.video_bytes = os.urandom(video_kb * 1024)
+    UpstreamHandler.image_bytes = os.urandom(16 * 1024)
+    server = UpstreamServer(('127.0.0.1', 0), UpstreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in ('parse', 'page', 'proxy', 'download'):
+            raise ValueError(f"未知的请求类型: {name}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def model_available(model: str) -> bool:
+    requires = WORKER_MODELS[model]['requires']
+    try:
+        __import__(requires)
+    except ImportError:
+        return False
+    return shutil.which(WORKER_MODELS[model]['cmd'][0]) is not None
+
+
+class AppServer:
+    """以指定 worker 模型启动 app.py 子进程"""
+
+    def __init__(self, model: str, workers: int, threads: int, workdir: str, preload: bool = True) -> None:
+        self.model = model
+        self.port = free_port()
+        self.preload = preload
+        params = {
+            'config': GUNICORN_CONFIG,
+            'bind': f'127.0.0.1:{self.port}',
+            'host': '127.0.0.1',
+            'port': str(self.port),
+            'workers': str(workers),
+            'threads': str(threads),
+            'connections': str(max(threads, 100)),
+        }
+        self.cmd = [part.format(**params) for part in WORKER_MODELS[model]['cmd']]
+        self.workdir = workdir
+        # 应用输出写入临时目录，启动失败时打印出来
+        self.log_path = os.path.join(workdir, 'app.log')
+        self.proc: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self, timeout: float = 60) -> None:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+        # 压测关注 worker 模型本身，放开本地模拟上游的限流
+        env.setdefault('UPSTREAM_RATE_LIMITS', json.dumps({'default': {'rate': 10000, 'burst': 10000}}))
+        # gunicorn.conf.py 读取这两个变量；关闭时作为对照组（每个 worker 各自导入应用）
+        env['GUNICORN_PRELOAD'] = '1' if self.preload else '0'
+        env['WARMUP'] = '1' if self.preload else '0'
+        with open(self.log_path, 'wb') as log:
+            self.proc = subprocess.Popen(
+                self.cmd, cwd=self.workdir, env=env,
+                stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                self.print_log()
+                raise RuntimeError(f"{self.model} 启动失败: {' '.join(self.cmd)}")
+            try:
+                with urllib.request.urlopen(self.base_url + '/api/platforms', timeout=1):
+                    return
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        self.stop()
+        self.print_log()
+        raise RuntimeError(f"{self.model} 启动超时")
+
+    def print_log(self, max_lines: int = 50) -> None:
+        """打印应用输出的最后几行"""
+        try:
+            with open(self.log_path, encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()[-max_lines:]
+        except OSError:
+            return
+        print(f"[{self.model}] 应用输出 ({self.log_path}):")
+        for line in lines:
+            print(f"    {line}")
+
+    def worker_memory_mb(self) -> List[float]:
+        """各 worker 进程的 RSS（MB）；没有子进程时（单进程模式）返回主进程"""
+        # 忽略 multiprocessing 的 resource_tracker 等辅助进程
+        pids = [pid for pid in _child_pids(self.proc.pid) if 'resource_tracker' not in _cmdline(pid)]
+        pids = pids or [self.proc.pid]
+        return [round(_rss_kb(pid) / 1024, 1) for pid in pids if _rss_kb(pid)]
+
+    def stop(self) -> None:
+        if self.proc and self.proc.poll() is None:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+
+
+def _child_pids(parent: int) -> List[int]:
+    try:
+        import psutil
+        return [child.pid for child in psutil.Process(parent).children()]
+    except ImportError:
+        pass
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 第 4 个字段是 ppid，进程名可能包含空格，从最后一个 ')' 之后解析
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == parent:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return f.read().replace(b'\0', b' ').decode(errors='replace')
+    except OSError:
+        return ''
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss // 1024
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class TrafficProfile:
+    """按权重生成 parse / page / download / proxy-image 混合请求"""
+
+    def __init__(self, base_url: str, upstream_url: str, mix: Dict[str, int]) -> None:
+        self.base_url = base_url
+        self.upstream_url = upstream_url
+        self.kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def build(self) -> Tuple[str, urllib.request.Request]:
+        kind = random.choice(self.kinds)
+        # 每个请求使用不同的视频 ID，避免命中解析缓存
+        video_id = self._next_id()
+        video_url = f'{self.upstream_url}/video/{video_id}.mp4'
+        if kind == 'parse':
+            body = {'url': video_url}
+            path = '/api/parse'
+        elif kind == 'page':
+            body = {'url': f'{self.upstream_url}/page/{video_id}.html'}
+            path = '/api/parse'
+        elif kind == 'download':
+            body = {'video_id': str(video_id), 'original_url': video_url, 'platform': 'loadtest'}
+            path = '/api/download'
+        else:
+            image_url = f'{self.upstream_url}/image/{video_id}.jpg'
+            return kind, urllib.request.Request(
+                f'{self.base_url}/api/proxy-image?url={urllib.parse.quote(image_url, safe="")}')
+        return kind, urllib.request.Request(
+            self.base_url + path, data=json.dumps(body).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST')
+
+
+def run_load(profile: TrafficProfile, concurrency: int, duration: float,
+             request_timeout: float) -> Dict[str, Any]:
+    """以固定并发（闭环）持续发送请求 duration 秒"""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    failures: Dict[str, int] = defaultdict(int)
+    status_counts: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client() -> None:
+        while time.monotonic() < stop_at:
+            kind, req = profile.build()
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(req, timeout=request_timeout) as resp:
+                    resp.read()
+                    status = resp.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception:
+                status = 'error'
+            elapsed = time.monotonic() - started
+            with lock:
+                latencies[kind].append(elapsed)
+                status_counts[str(status)] += 1
+                if status != 200:
+                    failures[kind] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.monotonic() - started
+
+    total = sum(len(v) for v in latencies.values())
+    all_latencies = [x for v in latencies.values() for x in v]
+    return {
+        'requests': total,
+        'wall_seconds': round(wall, 2),
+        'throughput_rps': round(total / wall, 2) if wall else 0,
+        'failure_rate': round(sum(failures.values()) / total, 4) if total else 0,
+        'status_counts': dict(status_counts),
+        'latency_ms': _percentiles(all_latencies),
+        'by_kind': {
+            kind: {
+                'requests': len(values),
+                'failures': failures[kind],
+                'latency_ms': _percentiles(values),
+            }
+            for kind, values in latencies.items()
+        },
+    }
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50': 0, 'p90': 0, 'p99': 0, 'max': 0}
+    samples = sorted(values)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': round(samples[-1] * 1000, 1)}
+
+
+def format_report(results: Dict[str, Dict[str, Any]]) -> str:
+    """生成 Markdown 对比表"""
+    lines = [
+        '| 模型 | 请求数 | 吞吐 (req/s) | p50 (ms) | p90 (ms) | p99 (ms) | 失败率 | worker 内存 (MB) |',
+        '| ---- | -----: | -----------: | -------: | -------: | -------: | -----: | ---------------- |',
+    ]
+    for model, result in results.items():
+        if 'skipped' in result:
+            lines.append(f"| {model} | - | - | - | - | - | - | 跳过: {result['skipped']} |")
+            continue
+        latency = result['latency_ms']
+        memory = ', '.join(str(m) for m in result['worker_memory_mb']) or '-'
+        lines.append(
+            f"| {model} | {result['requests']} | {result['throughput_rps']} | {latency['p50']} | "
+            f"{latency['p90']} | {latency['p99']} | {result['failure_rate']:.2%} | {memory} |"
+        )
+    lines.append('')
+    lines.append('按请求类型:')
+    lines.append('')
+    lines.append('| 模型 | 类型 | 请求数 | 失败数 | p50 (ms) | p99 (ms) |')
+    lines.append('| ---- | ---- | -----: | -----: | -------: | -------: |')
+    for model, result in results.items():
+        for kind, stats in sorted(result.get('by_kind', {}).items()):
+            lines.append(
+                f"| {model} | {kind} | {stats['requests']} | {stats['failures']} | "
+                f"{stats['latency_ms']['p50']} | {stats['latency_ms']['p99']} |"
+            )
+    return '\n'.join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='app.py 多 worker 模型压测')
+    parser.add_argument('--models', default=','.join(WORKER_MODELS),
+                        help=f"逗号分隔的 worker 模型，可选: {', '.join(WORKER_MODELS)}")
+    parser.add_argument('--workers', type=int, default=2, help='worker 进程数')
+    parser.add_argument('--threads', type=int, default=8, help='gthread 每个 worker 的线程数')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=20, help='每个模型的压测时长（秒）')
+    parser.add_argument('--warmup', type=float, default=2, help='正式压测前的预热时长（秒）')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='流量配比，例如 parse=3,page=3,proxy=3,download=1')
+    parser.add_argument('--upstream-latency', type=float, default=200, help='模拟上游平均延迟（毫秒）')
+    parser.add_argument('--video-kb', type=int, default=512, help='模拟视频大小（KB）')
+    parser.add_argument('--request-timeout', type=float, default=60, help='客户端单请求超时（秒）')
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help='gunicorn 模型关闭 preload / 预热 / gc.freeze，用于对比每个 worker 的内存')
+    parser.add_argument('--json', dest='json_path', help='同时把完整结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    upstream = start_upstream(args.upstream_latency / 1000, args.video_kb)
+    upstream_url = f'http://127.0.0.1:{upstream.server_address[1]}'
+    print(f"模拟上游: {upstream_url}  延迟≈{args.upstream_latency:.0f}ms  流量配比: {mix}  "
+          f"preload: {'开' if args.preload else '关'}")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for model in [m.strip() for m in args.models.split(',') if m.strip()]:
+        if model not in WORKER_MODELS:
+            print(f"未知的 worker 模型: {model}")
+            return 2
+        if not model_available(model):
+            results[model] = {'skipped': f"未安装 {WORKER_MODELS[model]['requires']}"}
+            print(f"[{model}] 跳过（未安装 {WORKER_MODELS[model]['requires']}）")
+            continue
+
+        workdir = tempfile.mkdtemp(prefix=f'loadtest-{model}-')
+        server = AppServer(model, args.workers, args.threads, workdir, args.preload)
+        try:
+            print(f"[{model}] 启动: {' '.join(server.cmd)}")
+            server.start()
+            profile = TrafficProfile(server.base_url, upstream_url, mix)
+            if args.warmup:
+                run_load(profile, args.concurrency, args.warmup, args.request_timeout)
+            result = run_load(profile, args.concurrency, args.duration, args.request_timeout)
+            result['worker_memory_mb'] = server.worker_memory_mb()
+            results[model] = result
+            print(f"[{model}] {result['throughput_rps']} req/s, p99 {result['latency_ms']['p99']}ms, "
+                  f"失败率 {result['failure_rate']:.2%}")
+        except RuntimeError as e:
+            results[model] = {'skipped': str(e)}
+            print(f"[{model}] {e}")
+        finally:
+            server.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    upstream.shutdown()
+    print()
+    print(format_report(results))
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+启动耗时基准
+
+在全新的 Python 进程中多次测量:
+- import universal_downloader
+- import app（包含 Flask、共享下载器实例）
+- warmup()（yt-dlp / curl_cffi 导入与提取器加载，即首次使用时的开销）
+
+用法:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --importtime 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行，输出各阶段耗时（毫秒）的 JSON
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import universal_downloader
+t_module = time.perf_counter()
+import app
+t_app = time.perf_counter()
+modules_before_warmup = len(sys.modules)
+warmup_steps = universal_downloader.warmup()
+t_warmup = time.perf_counter()
+print(json.dumps({
+    'import universal_downloader': (t_module - started) * 1000,
+    'import app': (t_app - t_module) * 1000,
+    'warmup': (t_warmup - t_app) * 1000,
+    'total': (t_warmup - started) * 1000,
+    'modules_before_warmup': modules_before_warmup,
+    'modules_after_warmup': len(sys.modules),
+}))
+"""
+
+
+def run_probe(workdir: str) -> Dict[str, float]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    # 允许写入 .pyc，测量的是常规部署下的启动耗时
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=workdir, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(workdir: str, module: str, top: int) -> List[str]:
+    """用 -X importtime 找出最慢的模块（累计耗时）"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # 格式: "import time:  self_us | cumulative_us | name"
+        _, cumulative_us, name = line.split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [f"{cumulative / 1000:8.1f} ms  {name}" for cumulative, name in rows[:top]]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='启动耗时基准')
+    parser.add_argument('--runs', type=int, default=5, help='测量次数（第一次作为预热丢弃）')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='额外输出 import app 时最慢的 N 个模块')
+    args = parser.parse_args()
+
+    # 在临时目录中运行，避免下载目录等副作用落到仓库里
+    with tempfile.TemporaryDirectory(prefix='startup-bench-') as workdir:
+        # 第一次运行会生成 .pyc，不计入结果
+        run_probe(workdir)
+        samples = [run_probe(workdir) for _ in range(args.runs)]
+
+        print(f"{'阶段':<28}{'中位数 (ms)':>14}{'最小 (ms)':>12}{'最大 (ms)':>12}")
+        for key in ('import universal_downloader', 'import app', 'warmup', 'total'):
+            values = [sample[key] for sample in samples]
+            print(f"{key:<28}{statistics.median(values):>14.1f}{min(values):>12.1f}{max(values):>12.1f}")
+        print(f"warmup 前已加载模块数: {samples[-1]['modules_before_warmup']}，"
+              f"warmup 后: {samples[-1]['modules_after_warmup']}")
+
+        if args.importtime:
+            print()
+            print(f"import app 最慢的 {args.importtime} 个模块:")
+            for line in import_profile(workdir, 'app', args.importtime):
+                print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+请求截止时间与取消
+每个 API 请求携带一个时间预算，所有出站调用只使用剩余预算；
+客户端断开连接时，正在进行的 yt-dlp / HTTP 请求会在下一个检查点被中断
+"""
+import contextvars
+import select
+import socket
+import threading
+import time
+from typing import Optional, Callable, Any
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求预算耗尽"""
+
+
+class RequestCancelled(Exception):
+    """客户端已断开连接"""
+
+
+class Deadline:
+    """请求截止时间，可选绑定一个取消检测函数"""
+
+    # 取消检测的最小间隔（秒），避免在下载循环中频繁探测 socket
+    CANCEL_CHECK_INTERVAL = 0.5
+
+    def __init__(self, budget: float, cancel_check: Optional[Callable[[], bool]] = None) -> None:
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self._cancel_check = cancel_check
+        self._cancelled = False
+        self._last_cancel_check = 0.0
+        # call() 超时或取消后放弃等待、仍在运行的后台线程
+        self.abandoned = []
+
+    def remaining(self) -> float:
+        """剩余预算（秒），不会小于 0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, cap: Optional[float] = None, floor: float = 0.1) -> float:
+        """
+        给出站调用使用的超时时间
+        预算已耗尽时直接抛出 DeadlineExceeded，而不是发起一个必然超时的请求
+        """
+        self.check()
+        value = self.remaining()
+        if cap is not None:
+            value = min(value, cap)
+        return max(floor, value)
+
+    def cancelled(self) -> bool:
+        """客户端是否已断开"""
+        if self._cancelled or self._cancel_check is None:
+            return self._cancelled
+        now = time.monotonic()
+        if now - self._last_cancel_check >= self.CANCEL_CHECK_INTERVAL:
+            self._last_cancel_check = now
+            try:
+                self._cancelled = bool(self._cancel_check())
+            except Exception:
+                pass
+        return self._cancelled
+
+    def check(self) -> None:
+        """检查点：已取消或已超时则抛出异常"""
+        if self.cancelled():
+            raise RequestCancelled("client disconnected")
+        if time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded(f"request budget of {self.budget:.0f}s exceeded")
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        在后台线程中执行阻塞调用，最多等待剩余预算
+        超时或取消时立即抛出异常，后台线程会在它的下一个检查点退出，
+        这样即使上游逐字节慢速返回，也不会把 worker 一直占住
+        """
+        self.check()
+        outcome = {}
+        # 后台线程沿用当前请求的上下文（例如剖析器）
+        context = contextvars.copy_context()
+
+        def target() -> None:
+            try:
+                outcome['result'] = context.run(func, *args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+
+        worker = threading.Thread(target=target, daemon=True)
+        worker.start()
+        while True:
+            worker.join(min(self.CANCEL_CHECK_INTERVAL, self.remaining()))
+            if not worker.is_alive():
+                break
+            try:
+                self.check()
+            except (DeadlineExceeded, RequestCancelled):
+                self.abandoned.append(worker)
+                raise
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+
+    def join_abandoned(self, timeout: float) -> bool:
+        """等待被放弃的后台线程退出（例如清理它们写入的文件之前），全部退出返回 True"""
+        expires_at = time.monotonic() + timeout
+        for worker in self.abandoned:
+            worker.join(max(0.0, expires_at - time.monotonic()))
+        return not any(worker.is_alive() for worker in self.abandoned)
+
+
+def socket_disconnect_check(sock: Optional[socket.socket]) -> Optional[Callable[[], bool]]:
+    """
+    根据 WSGI 服务器暴露的客户端 socket 生成断开检测函数
+    gunicorn 提供 environ['gunicorn.socket']，werkzeug 开发服务器提供 environ['werkzeug.socket']
+    """
+    if sock is None:
+        return None
+
+    def is_disconnected() -> bool:
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return False
+            # socket 可读但窥探不到数据，说明对端已关闭
+            return sock.recv(1, socket.MSG_PEEK) == b''
+        except (BlockingIOError, InterruptedError):
+            return False
+        except (ConnectionError, OSError, ValueError):
+            return True
+
+    return is_disconnected
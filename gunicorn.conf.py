@@ -0,0 +1,19 @@
+"""
+gunicorn 配置（gunicorn 启动时自动读取当前目录下的 gunicorn.conf.py）
+默认开启 preload：master 先导入应用并预热 yt-dlp / curl_cffi，再 fork 出 worker，
+worker 通过写时复制共享这些模块，冷启动和首个请求都不再重复导入
+"""
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    if os.environ.get('WARMUP', '1') != '1':
+        return
+    from universal_downloader import warmup
+    timings = warmup()
+    server.log.info("warmup: %s", ', '.join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items()))
+    # 把预热后的对象移出 GC 追踪，避免 worker 中的 GC 触碰这些页导致写时复制失效
+    gc.freeze()
@@ -0,0 +1,341 @@
+"""
+请求级性能剖析
+- 阶段计时：在关键路径上用 stage() 标记（URL 提取、抖音页面抓取/解析、yt-dlp 提取等）
+- 栈采样 / cProfile：按采样率或请求头对单个请求开启
+- 慢请求记录：保留最慢的 N 个请求及其阶段耗时，可导出为火焰图使用的 collapsed stacks 格式
+
+未开启时 stage() 只做一次 ContextVar 读取，开销可以忽略
+"""
+import contextvars
+import cProfile
+import heapq
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Dict, Any, List
+
+# 为每个请求记录阶段耗时（慢请求日志依赖此项）
+PROFILE_STAGES = os.environ.get('PROFILE_STAGES', '0') == '1'
+# 随机对一部分请求做栈采样（0 ~ 1）
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# 栈采样间隔（秒）
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+# 保留最慢的请求数
+PROFILE_SLOW_N = int(os.environ.get('PROFILE_SLOW_N', 20))
+
+MODES = ('sample', 'cprofile')
+
+# Python 3.12 起 cProfile 基于 sys.monitoring，同一时间只能有一个剖析器且作用于所有线程，
+# 不能再为后台线程单独开启（enable 会抛出 ValueError）
+CPROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+_current: contextvars.ContextVar = contextvars.ContextVar('request_profile', default=None)
+_ids = itertools.count(1)
+
+
+class RequestProfile:
+    """单个请求的剖析数据"""
+
+    def __init__(self, method: str, path: str, mode: Optional[str] = None) -> None:
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.mode = mode
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.status = None
+        self.stages: List[Dict[str, Any]] = []
+        self.stacks: Counter = Counter()
+        self.owner = threading.get_ident()
+        self.threads = {self.owner}
+        # 各线程当前所处的阶段栈 [(name, started)]，采样时作为栈的根帧
+        self.active_stages: Dict[int, List[Any]] = {}
+        self.finished = False
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._cprofilers: Dict[int, cProfile.Profile] = {}
+        self.cprofile_stats = ''
+        self._stats: Optional[pstats.Stats] = None
+        self.token: Optional[contextvars.Token] = None
+
+    def start(self) -> None:
+        if self.mode == 'sample':
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self._sampler.start()
+        elif self.mode == 'cprofile':
+            self._enable_cprofile()
+
+    def finish(self, status: Optional[int] = None) -> None:
+        self.duration = time.perf_counter() - self.started
+        self.status = status
+        with self._lock:
+            self.finished = True
+            # 超时被放弃的后台调用还停留在阶段中，按请求结束时间记为未完成
+            for ident, stack in self.active_stages.items():
+                for depth, (name, started) in enumerate(stack):
+                    self.stages.append({
+                        'name': name,
+                        'start_ms': round((started - self.started) * 1000, 1),
+                        'duration_ms': round((self.started + self.duration - started) * 1000, 1),
+                        'depth': depth,
+                        'unfinished': True,
+                    })
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+        if self.mode == 'cprofile':
+            self._disable_cprofile()
+            self.cprofile_stats = self._format_cprofile()
+
+    def _enable_cprofile(self) -> None:
+        # 3.12 之前 cProfile 只作用于当前线程，yt-dlp 所在的后台线程在进入阶段时单独开启
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self._cprofilers or (self._cprofilers and not CPROFILE_PER_THREAD):
+                return
+            profiler = self._cprofilers[ident] = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # 其他请求（或其他剖析工具）正在使用 cProfile，本次放弃剖析，不影响请求本身
+            with self._lock:
+                self._cprofilers.pop(ident, None)
+            print(f"[profiler] 无法开启 cProfile: {e}")
+
+    def _disable_cprofile(self) -> None:
+        profiler = self._cprofilers.get(threading.get_ident())
+        if profiler:
+            profiler.disable()
+
+    def _format_cprofile(self, limit: int = 40) -> str:
+        output = io.StringIO()
+        stats = None
+        for profiler in list(self._cprofilers.values()):
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profiler, stream=output)
+                else:
+                    stats.add(profiler)
+            except TypeError:
+                # 剖析器没有采集到任何调用（例如后台线程还没运行就被放弃）
+                continue
+        if stats is None:
+            return ''
+        stats.sort_stats('cumulative').print_stats(limit)
+        self._stats = stats
+        return output.getvalue()
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self._lock:
+                stages_by_thread = {
+                    ident: [f"stage:{name}" for name, _ in self.active_stages.get(ident, [])]
+                    for ident in self.threads
+                }
+            for ident, stages in stages_by_thread.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[';'.join(stages + stack)] += 1
+
+    def enter_stage(self, name: str) -> float:
+        ident = threading.get_ident()
+        with self._lock:
+            new_thread = ident not in self.threads
+            self.threads.add(ident)
+        if new_thread and self.mode == 'cprofile':
+            self._enable_cprofile()
+        started = time.perf_counter()
+        with self._lock:
+            self.active_stages.setdefault(ident, []).append((name, started))
+        return started
+
+    def exit_stage(self, name: str, started: float) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            stack = self.active_stages.get(ident)
+            if stack:
+                stack.pop()
+            if self.finished:
+                return
+            self.stages.append({
+                'name': name,
+                'start_ms': round((started - self.started) * 1000, 1),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                'depth': len(stack or []),
+            })
+        # 后台线程的最外层阶段结束时停止该线程的 cProfile（3.12+ 只有请求线程的一个剖析器）
+        if self.mode == 'cprofile' and not stack and ident != self.owner and ident in self._cprofilers:
+            self._cprofilers[ident].disable()
+
+    def stage_inclusive_totals(self) -> Dict[str, float]:
+        """
+        各阶段累计耗时（毫秒），包含嵌套在其中的子阶段
+        例如 card_ytdlp_flat 包含 ytdlp_flat，因此各项相加可能大于请求总耗时
+        """
+        totals: Dict[str, float] = {}
+        for item in self.stages:
+            totals[item['name']] = round(totals.get(item['name'], 0) + item['duration_ms'], 1)
+        return totals
+
+    def collapsed(self) -> List[str]:
+        """collapsed stacks 行，以请求作为根帧，便于在同一张火焰图中区分"""
+        root = f"request:{self.id} {self.method} {self.path}"
+        if self.stacks:
+            return [f"{root};{stack} {count}" for stack, count in self.stacks.items()]
+        if self.mode == 'cprofile' and self._stats:
+            # cProfile 没有完整调用栈，按函数自身耗时（毫秒）输出单层栈
+            lines = []
+            for (filename, _, func), (_, _, self_time, _, _) in self._stats.stats.items():
+                weight = int(self_time * 1000)
+                if weight:
+                    lines.append(f"{root};{os.path.basename(filename)}:{func} {weight}")
+            return lines
+        # 没有栈采样时，用阶段耗时（毫秒）生成栈
+        return [
+            f"{root};stage:{item['name']} {int(item['duration_ms'])}"
+            for item in self.stages if int(item['duration_ms'])
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 1),
+            'stage_inclusive_ms': self.stage_inclusive_totals(),
+            'stages': self.stages,
+            'samples': sum(self.stacks.values()),
+            'cprofile': self.cprofile_stats,
+        }
+
+    def __lt__(self, other: 'RequestProfile') -> bool:
+        return self.duration < other.duration
+
+
+class SlowRequestLog:
+    """保留耗时最长的 N 个请求（小顶堆）"""
+
+    def __init__(self, size: int = PROFILE_SLOW_N) -> None:
+        self.size = size
+        self._heap: List[RequestProfile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, profile)
+            elif self._heap and profile.duration > self._heap[0].duration:
+                heapq.heapreplace(self._heap, profile)
+
+    def items(self) -> List[RequestProfile]:
+        with self._lock:
+            return sorted(self._heap, key=lambda p: p.duration, reverse=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap = []
+
+
+slow_requests = SlowRequestLog()
+
+
+class _Stage:
+    __slots__ = ('profile', 'name', 'started')
+
+    def __init__(self, profile: RequestProfile, name: str) -> None:
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self) -> '_Stage':
+        self.started = self.profile.enter_stage(self.name)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.profile.exit_stage(self.name, self.started)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullStage':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str):
+    """标记一个处理阶段；当前请求未开启剖析时为空操作"""
+    profile = _current.get()
+    if profile is None:
+        return _NULL_STAGE
+    return _Stage(profile, name)
+
+
+def traced(name: str, func):
+    """包装函数，使其在指定阶段中执行（用于交给 Deadline.call 在后台线程运行的调用）"""
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with stage(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def start_request(method: str, path: str, forced_mode: Optional[str] = None) -> Optional[RequestProfile]:
+    """
+    请求开始时调用，按配置决定是否剖析
+    forced_mode 来自请求头（sample / cprofile），由调用方负责鉴权
+    """
+    mode = forced_mode if forced_mode in MODES else None
+    if mode is None and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        mode = 'sample'
+    if mode is None and not PROFILE_STAGES:
+        return None
+    profile = RequestProfile(method, path, mode)
+    profile.token = _current.set(profile)
+    profile.start()
+    return profile
+
+
+def finish_request(profile: Optional[RequestProfile], status: Optional[int] = None) -> None:
+    """请求结束时调用，把结果写入慢请求日志；剖析出错时只打印日志，不影响请求"""
+    if profile is None:
+        return
+    try:
+        profile.finish(status)
+    except Exception as e:
+        print(f"[profiler] 结束剖析失败: {e}")
+    try:
+        _current.reset(profile.token)
+    except ValueError:
+        _current.set(None)
+    slow_requests.add(profile)
+
+
+def collapsed_stacks(profiles: List[RequestProfile]) -> str:
+    """导出 collapsed stacks 文本（可直接交给 flamegraph.pl / speedscope）"""
+    lines = []
+    for profile in profiles:
+        lines.extend(profile.collapsed())
+    return '\n'.join(lines) + ('\n' if lines else '')
@@ -0,0 +1,325 @@
+"""
+上游平台限流与熔断
+按平台维护令牌桶（根据 429/403/超时 自适应调整速率）和熔断器（指数退避 + 随机抖动），
+令牌不足时在调用方允许的时间内短暂排队，平台开始限流（熔断）时快速失败，避免每个请求都等到超时
+"""
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple, Iterator
+
+from deadline import DeadlineExceeded, RequestCancelled
+
+
+# 各平台初始速率（每秒请求数）与桶容量，未列出的平台使用 default
+# 未识别的站点按域名分组（other:<host>），可用 'other' 为它们单独配置
+# 注意：限流器状态保存在每个进程内，gunicorn -w 4 时整体速率是配置值的 4 倍，
+# /api/metrics 也只反映处理该请求的那个 worker
+PLATFORM_LIMITS = {
+    'default': {'rate': 5.0, 'burst': 10},
+    'douyin': {'rate': 2.0, 'burst': 5},
+    'instagram': {'rate': 1.0, 'burst': 3},
+    'tiktok': {'rate': 2.0, 'burst': 5},
+}
+
+# 允许通过环境变量覆盖，例如 UPSTREAM_RATE_LIMITS='{"default": {"rate": 50, "burst": 100}}'
+if os.environ.get('UPSTREAM_RATE_LIMITS'):
+    PLATFORM_LIMITS.update(json.loads(os.environ['UPSTREAM_RATE_LIMITS']))
+
+# 视为“被限流”的错误类型（连接失败通常意味着平台故障或封禁 IP，同样需要退避）
+THROTTLE_KINDS = ('rate_limited', 'forbidden', 'timeout', 'connection')
+
+
+class UpstreamUnavailable(Exception):
+    """平台处于熔断或限流状态时抛出"""
+
+    def __init__(self, platform: str, retry_after: float, reason: str) -> None:
+        self.platform = platform
+        self.retry_after = max(0.0, retry_after)
+        self.reason = reason
+        super().__init__(f"{platform} {reason}, retry after {self.retry_after:.1f}s")
+
+
+class UpstreamHTTPError(Exception):
+    """上游返回了表示限流/拒绝的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, url: str = '') -> None:
+        self.status_code = status_code
+        super().__init__(f"HTTP Error {status_code}: {url}")
+
+
+def classify_upstream_error(error: Any) -> Optional[str]:
+    """
+    根据状态码 / 异常类型判断上游错误类别
+    返回: 'rate_limited' | 'forbidden' | 'timeout' | 'connection' | None
+    """
+    status = error if isinstance(error, int) else None
+    seen = set()
+    current = None if status is not None else error
+    # 沿异常链查找状态码（yt-dlp 的 DownloadError 把原始异常放在 exc_info 中）
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        # 本地请求预算耗尽 / 客户端断开与上游健康状况无关（DeadlineExceeded 是 TimeoutError 的子类）
+        if isinstance(current, (DeadlineExceeded, RequestCancelled)):
+            return None
+        if isinstance(current, (socket.timeout, TimeoutError)) or 'Timeout' in type(current).__name__:
+            return 'timeout'
+        if isinstance(current, ConnectionError) or 'ConnectionError' in type(current).__name__:
+            return 'connection'
+        for attr in ('status_code', 'status', 'code'):
+            value = getattr(current, attr, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                status = value
+                break
+        if status is None:
+            response = getattr(current, 'response', None)
+            value = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+            if isinstance(value, int):
+                status = value
+        if status is not None:
+            break
+        exc_info = getattr(current, 'exc_info', None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and exc_info[1] is not None:
+            current = exc_info[1]
+        elif isinstance(current, BaseException):
+            current = current.__cause__ or current.__context__
+        else:
+            # 调用方也可能直接传入错误信息字符串
+            current = None
+
+    if status is None:
+        message = str(error)
+        match = re.search(r'HTTP Error (\d{3})', message)
+        if match:
+            status = int(match.group(1))
+        elif 'timed out' in message.lower() or 'timeout' in message.lower():
+            return 'timeout'
+
+    if status == 429:
+        return 'rate_limited'
+    if status == 403:
+        return 'forbidden'
+    if status in (408, 504):
+        return 'timeout'
+    return None
+
+
+class TokenBucket:
+    """令牌桶，速率可在 min_rate ~ max_rate 之间自适应调整（AIMD）"""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.max_rate = rate
+        self.min_rate = rate / 20
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, now: float) -> float:
+        """尝试取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def on_success(self) -> None:
+        # 加性增长
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttle(self) -> None:
+        # 乘性下降
+        self.rate = max(self.min_rate, self.rate / 2)
+
+
+class CircuitBreaker:
+    """熔断器: closed -> open -> half_open -> closed，打开时长按指数退避并加随机抖动"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, window: float = 60.0,
+                 base_delay: float = 5.0, max_delay: float = 300.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = self.CLOSED
+        self.failures = []
+        self.trips = 0
+        self.opened_until = 0.0
+        self.probing = False
+
+    def before_call(self, now: float) -> float:
+        """允许调用返回 0，否则返回距离下次探测的秒数"""
+        if self.state == self.OPEN:
+            if now < self.opened_until:
+                return self.opened_until - now
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.HALF_OPEN:
+            # 半开状态只放行一个探测请求
+            if self.probing:
+                return 1.0
+            self.probing = True
+        return 0.0
+
+    def on_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = []
+        self.trips = 0
+        self.probing = False
+
+    def on_throttle(self, now: float) -> None:
+        self.failures = [t for t in self.failures if now - t < self.window]
+        self.failures.append(now)
+        if self.state == self.HALF_OPEN or len(self.failures) >= self.failure_threshold:
+            self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        delay = min(self.max_delay, self.base_delay * (2 ** self.trips))
+        # full jitter 的变体：保留一半确定延迟，避免所有 worker 同时恢复
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.trips += 1
+        self.state = self.OPEN
+        self.opened_until = now + delay
+        self.failures = []
+        self.probing = False
+
+
+class PlatformLimiter:
+    """按平台管理令牌桶与熔断器，并记录统计数据"""
+
+    # 最多跟踪的按域名分组的站点数，超出时淘汰最久未使用且未熔断的站点
+    MAX_SITES = 256
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+        self.limits = limits or PLATFORM_LIMITS
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict = OrderedDict()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _get(self, platform: str) -> Tuple[TokenBucket, CircuitBreaker, Dict[str, int]]:
+        if platform in self._buckets:
+            self._buckets.move_to_end(platform)
+        else:
+            if ':' in platform:
+                self._evict_sites()
+            group = platform.split(':', 1)[0]
+            conf = self.limits.get(platform) or self.limits.get(group) or self.limits['default']
+            self._buckets[platform] = TokenBucket(conf['rate'], int(conf['burst']))
+            self._breakers[platform] = CircuitBreaker()
+            self._stats[platform] = {
+                'allowed': 0, 'queued': 0, 'rejected': 0, 'success': 0, 'failure': 0,
+                'rate_limited': 0, 'forbidden': 0, 'timeout': 0, 'connection': 0,
+            }
+        return self._buckets[platform], self._breakers[platform], self._stats[platform]
+
+    def _evict_sites(self) -> None:
+        sites = [key for key in self._buckets if ':' in key]
+        if len(sites) < self.MAX_SITES:
+            return
+        for key in sites:
+            if self._breakers[key].state == CircuitBreaker.CLOSED:
+                del self._buckets[key], self._breakers[key], self._stats[key]
+                return
+
+    def acquire(self, platform: str, max_wait: float = 0.0) -> bool:
+        """
+        申请一次上游调用，返回本次调用是否为半开状态下的探测请求
+        令牌不足但在 max_wait 秒内能补充时排队等待；熔断中或等待时间超出 max_wait 时抛出 UpstreamUnavailable
+        """
+        expires_at = time.monotonic() + max_wait
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                bucket, breaker, stats = self._get(platform)
+                wait = breaker.before_call(now)
+                if wait > 0:
+                    stats['rejected'] += 1
+                    raise UpstreamUnavailable(platform, wait, 'circuit open')
+                wait = bucket.try_acquire(now)
+                if wait <= 0:
+                    stats['allowed'] += 1
+                    return breaker.state == CircuitBreaker.HALF_OPEN
+                # 半开探测没拿到令牌时释放探测名额
+                breaker.probing = False
+                if now + wait > expires_at:
+                    stats['rejected'] += 1
+                    raise UpstreamUnavailable(platform, wait, 'rate limited')
+                stats['queued'] += 1
+            time.sleep(wait)
+
+    def record(self, platform: str, error: Any = None) -> Optional[str]:
+        """记录一次上游调用结果，返回错误类别"""
+        kind = classify_upstream_error(error) if error is not None else None
+        now = time.monotonic()
+        with self._lock:
+            bucket, breaker, stats = self._get(platform)
+            if error is None:
+                stats['success'] += 1
+                bucket.on_success()
+                breaker.on_success()
+            elif kind in THROTTLE_KINDS:
+                stats['failure'] += 1
+                stats[kind] += 1
+                bucket.on_throttle()
+                breaker.on_throttle(now)
+            else:
+                # 普通失败（视频不存在等）不代表平台在限流，但需要结束半开探测
+                stats['failure'] += 1
+                if breaker.state == CircuitBreaker.HALF_OPEN:
+                    breaker.on_success()
+        return kind
+
+    def release(self, platform: str) -> None:
+        """调用被取消、没有结果时释放半开探测名额"""
+        with self._lock:
+            _, breaker, _ = self._get(platform)
+            if breaker.state == CircuitBreaker.HALF_OPEN:
+                breaker.probing = False
+
+    @contextmanager
+    def permit(self, platform: str, max_wait: float = 0.0) -> Iterator[None]:
+        """
+        acquire 的上下文管理器版本
+        探测请求提前返回或抛出异常、没有调用 record 时也会释放探测名额，避免平台一直停在半开状态
+        """
+        probe = self.acquire(platform, max_wait)
+        try:
+            yield
+        finally:
+            if probe:
+                self.release(platform)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出各平台限流器状态，供 metrics 接口使用"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for platform, bucket in self._buckets.items():
+                breaker = self._breakers[platform]
+                bucket._refill(now)
+                result[platform] = {
+                    'state': breaker.state,
+                    'retry_after': round(max(0.0, breaker.opened_until - now), 1)
+                    if breaker.state == CircuitBreaker.OPEN else 0,
+                    'trips': breaker.trips,
+                    'rate': round(bucket.rate, 3),
+                    'max_rate': bucket.max_rate,
+                    'tokens': round(bucket.tokens, 2),
+                    'stats': dict(self._stats[platform]),
+                }
+            return result
@@ -6,6 +6,12 @@ const state = {
     platform: null
 };
 
+// 请求预算（秒），通过 X-Request-Timeout 告知服务端；前端多等 5 秒后再中断请求
+const TIMEOUTS = {
+    parse: 30,
+    download: 300
+};
+
 // DOM 元素引用
 const elements = {
     shareUrlInput: document.getElementById("shareUrl"),
@@ -70,11 +76,11 @@ async function handleParse() {
     toggleUI('video', false);
 
     try {
-        const res = await fetch("/api/parse", {
+        const res = await fetchWithTimeout("/api/parse", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ url })
-        });
+        }, TIMEOUTS.parse);
         const data = await res.json();
 
         if (res.ok && data.success) {
@@ -86,7 +92,7 @@ async function handleParse() {
             notify('error', data.error || "解析引擎繁忙，请稍后再试");
         }
     } catch (e) {
-        notify('error', "云端连接失败，请检查网络");
+        notify('error', e.name === 'AbortError' ? "解析超时，请稍后再试" : "云端连接失败，请检查网络");
     } finally {
         toggleUI('loading', false);
     }
@@ -99,7 +105,7 @@ async function handleDownload() {
     toggleUI('video', false);
 
     try {
-        const res = await fetch("/api/download", {
+        const res = await fetchWithTimeout("/api/download", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({
@@ -108,7 +114,7 @@ async function handleDownload() {
                 original_url: state.originalUrl,
                 platform: state.platform
             })
-        });
+        }, TIMEOUTS.download);
         const data = await res.json();
 
         if (res.ok && data.success) {
@@ -120,7 +126,7 @@ async function handleDownload() {
             toggleUI('video', true);
         }
     } catch (e) {
-        notify('error', "下载引擎异常");
+        notify('error', e.name === 'AbortError' ? "下载超时，请稍后再试" : "下载引擎异常");
         toggleUI('video', true);
     } finally {
         toggleUI('progress', false);
@@ -170,6 +176,18 @@ async function handleCleanup() {
 }
 
 // 辅助工具
+async function fetchWithTimeout(url, options, seconds) {
+    // 超时后中断请求，服务端检测到连接断开会取消正在进行的解析/下载
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), (seconds + 5) * 1000);
+    const headers = { ...options.headers, "X-Request-Timeout": String(seconds) };
+    try {
+        return await fetch(url, { ...options, headers, signal: controller.signal });
+    } finally {
+        clearTimeout(timer);
+    }
+}
+
 function toggleUI(key, show) {
     const map = {
         loading: elements.loadingSection,
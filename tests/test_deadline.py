@@ -0,0 +1,53 @@
+"""
+deadline 的预算 / 后台调用测试
+"""
+import threading
+import time
+import unittest
+
+from deadline import Deadline, DeadlineExceeded, RequestCancelled
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_timeout_is_capped_by_remaining_budget(self):
+        deadline = Deadline(5)
+        self.assertLessEqual(deadline.timeout(), 5)
+        self.assertEqual(deadline.timeout(cap=1), 1)
+
+    def test_expired_budget_raises(self):
+        deadline = Deadline(0)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.timeout()
+
+    def test_cancel_check(self):
+        deadline = Deadline(5, cancel_check=lambda: True)
+        with self.assertRaises(RequestCancelled):
+            deadline.check()
+
+    def test_call_returns_result_and_error(self):
+        deadline = Deadline(5)
+        self.assertEqual(deadline.call(lambda a, b=0: a + b, 1, b=2), 3)
+        with self.assertRaises(ValueError):
+            deadline.call(self._raise_value_error)
+        self.assertEqual(deadline.abandoned, [])
+
+    def test_call_gives_up_on_slow_worker(self):
+        release = threading.Event()
+        deadline = Deadline(0.2)
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            deadline.call(release.wait, 10)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(len(deadline.abandoned), 1)
+        self.assertFalse(deadline.join_abandoned(0.05))
+        release.set()
+        self.assertTrue(deadline.join_abandoned(1))
+
+    @staticmethod
+    def _raise_value_error():
+        raise ValueError('boom')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+profiler 的阶段计时 / 慢请求日志 / collapsed stacks 测试
+"""
+import threading
+import time
+import unittest
+from unittest import mock
+
+import profiler
+from profiler import RequestProfile, SlowRequestLog
+
+
+def make_profile(duration: float, path: str = '/api/parse') -> RequestProfile:
+    profile = RequestProfile('POST', path)
+    profile.duration = duration
+    return profile
+
+
+class SlowRequestLogTest(unittest.TestCase):
+
+    def test_keeps_slowest_n(self):
+        log = SlowRequestLog(size=3)
+        for duration in (0.5, 0.1, 0.9, 0.3, 0.7, 0.2):
+            log.add(make_profile(duration))
+        self.assertEqual([p.duration for p in log.items()], [0.9, 0.7, 0.5])
+
+    def test_clear(self):
+        log = SlowRequestLog(size=3)
+        log.add(make_profile(1.0))
+        log.clear()
+        self.assertEqual(log.items(), [])
+
+
+class StageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = RequestProfile('POST', '/api/parse')
+        token = profiler._current.set(self.profile)
+        self.addCleanup(profiler._current.reset, token)
+
+    def test_nested_stages_record_depth(self):
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                pass
+        self.profile.finish(200)
+        depths = {item['name']: item['depth'] for item in self.profile.stages}
+        self.assertEqual(depths, {'outer': 0, 'inner': 1})
+
+    def test_inclusive_totals_include_children_and_repeats(self):
+        with mock.patch('profiler.time.perf_counter', side_effect=[0.0, 0.1, 0.2, 0.4, 0.5, 0.7]):
+            with profiler.stage('card'):
+                with profiler.stage('fetch'):
+                    pass
+            with profiler.stage('fetch'):
+                pass
+        # card 共 400ms，包含第一次 fetch 的 100ms；fetch 两次共 300ms
+        self.assertEqual(self.profile.stage_inclusive_totals(), {'card': 400.0, 'fetch': 300.0})
+
+    def test_unfinished_stage_is_closed_at_finish(self):
+        stage = profiler.stage('abandoned')
+        stage.__enter__()
+        self.profile.finish(504)
+        self.assertTrue(self.profile.stages[0]['unfinished'])
+
+    def test_stage_is_noop_without_profile(self):
+        profiler._current.set(None)
+        self.assertIs(profiler.stage('x'), profiler._NULL_STAGE)
+
+
+class CollapsedTest(unittest.TestCase):
+
+    def test_sampled_stacks(self):
+        profile = RequestProfile('POST', '/api/parse', 'sample')
+        profile.stacks['stage:ytdlp;app.py:parse_url'] = 3
+        self.assertEqual(profile.collapsed(),
+                         [f'request:{profile.id} POST /api/parse;stage:ytdlp;app.py:parse_url 3'])
+
+    def test_falls_back_to_stage_durations(self):
+        profile = RequestProfile('GET', '/api/proxy-image')
+        profile.stages = [
+            {'name': 'proxy_fetch', 'start_ms': 0, 'duration_ms': 12.7, 'depth': 0},
+            {'name': 'tiny', 'start_ms': 0, 'duration_ms': 0.4, 'depth': 0},
+        ]
+        self.assertEqual(profile.collapsed(), [f'request:{profile.id} GET /api/proxy-image;stage:proxy_fetch 12'])
+
+    def test_collapsed_stacks_joins_profiles(self):
+        profiles = [make_profile(0.1), make_profile(0.2)]
+        for profile in profiles:
+            profile.stages = [{'name': 'extract', 'start_ms': 0, 'duration_ms': 5, 'depth': 0}]
+        text = profiler.collapsed_stacks(profiles)
+        self.assertEqual(text.count('\n'), 2)
+        self.assertTrue(text.endswith(';stage:extract 5\n'))
+        self.assertEqual(profiler.collapsed_stacks([]), '')
+
+
+class SamplerTest(unittest.TestCase):
+
+    def test_sampler_survives_thread_entering_stage(self):
+        # 回归：采样线程遍历 threads 集合时，后台线程进入阶段修改了集合（Set changed size during iteration），
+        # 采样线程因此退出。遍历到一半时让另一个线程进入阶段，它必须等采样线程读完集合
+        profile = RequestProfile('POST', '/api/parse', 'sample')
+        iterated = threading.Event()
+        racers = []
+
+        def enter_stage():
+            profile.exit_stage('worker', profile.enter_stage('worker'))
+
+        class RacingSet(set):
+            def __iter__(self):
+                items = super().__iter__()
+                yield next(items)
+                if not racers:
+                    racers.append(threading.Thread(target=enter_stage))
+                    racers[0].start()
+                    racers[0].join(0.05)
+                    iterated.set()
+                yield from items
+
+        profile.threads = RacingSet(profile.threads)
+        with mock.patch('profiler.PROFILE_SAMPLE_INTERVAL', 0.001):
+            profile.start()
+            self.assertTrue(iterated.wait(2))
+            racers[0].join(2)
+            time.sleep(0.01)
+            alive = profile._sampler.is_alive()
+            profile.finish(200)
+        self.assertTrue(alive)
+        self.assertEqual(len(profile.threads), 2)
+        self.assertGreater(sum(profile.stacks.values()), 0)
+
+
+class FinishRequestTest(unittest.TestCase):
+
+    def test_profiler_error_does_not_propagate(self):
+        profile = profiler.start_request('GET', '/api/platforms', 'cprofile')
+        with mock.patch.object(profile, '_format_cprofile', side_effect=TypeError('boom')):
+            profiler.finish_request(profile, 200)
+        self.assertIsNone(profiler._current.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
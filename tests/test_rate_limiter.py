@@ -0,0 +1,245 @@
+"""
+rate_limiter 的状态机测试（熔断器 / 平台限流器 / 错误分类），不依赖网络
+"""
+import socket
+import unittest
+from unittest import mock
+
+from deadline import DeadlineExceeded, RequestCancelled
+from rate_limiter import (
+    CircuitBreaker, PlatformLimiter, UpstreamHTTPError, UpstreamUnavailable, classify_upstream_error,
+)
+
+LIMITS = {'default': {'rate': 100.0, 'burst': 100}}
+
+
+class FakeClock:
+    """替换 rate_limiter 中的 time.monotonic"""
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_trips_after_threshold_within_window(self):
+        breaker = CircuitBreaker(failure_threshold=3, window=60)
+        breaker.on_throttle(0)
+        breaker.on_throttle(10)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.on_throttle(20)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertGreater(breaker.before_call(20), 0)
+
+    def test_failures_outside_window_are_forgotten(self):
+        breaker = CircuitBreaker(failure_threshold=3, window=60)
+        breaker.on_throttle(0)
+        breaker.on_throttle(10)
+        breaker.on_throttle(100)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_single_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, base_delay=10)
+        breaker.on_throttle(0)
+        self.assertEqual(breaker.before_call(breaker.opened_until), 0)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertGreater(breaker.before_call(breaker.opened_until), 0)
+
+    def test_probe_success_closes(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.on_throttle(0)
+        breaker.before_call(breaker.opened_until)
+        breaker.on_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.trips, 0)
+        self.assertEqual(breaker.before_call(breaker.opened_until), 0)
+
+    def test_probe_failure_reopens_with_longer_delay(self):
+        breaker = CircuitBreaker(failure_threshold=1, base_delay=10, max_delay=1000)
+        breaker.on_throttle(0)
+        first_delay = breaker.opened_until
+        now = breaker.opened_until
+        breaker.before_call(now)
+        breaker.on_throttle(now)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.trips, 2)
+        # 第二次打开的时长在 [10, 20) 之间，第一次在 [5, 10) 之间
+        self.assertGreater(breaker.opened_until - now, first_delay)
+
+
+class PlatformLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('rate_limiter.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = PlatformLimiter(LIMITS)
+
+    def trip(self, platform: str) -> None:
+        for _ in range(3):
+            with self.limiter.permit(platform):
+                self.limiter.record(platform, 429)
+        self.assertEqual(self.limiter.snapshot()[platform]['state'], CircuitBreaker.OPEN)
+
+    def half_open(self, platform: str) -> None:
+        self.trip(platform)
+        self.clock.now += 1000
+
+    def test_open_circuit_rejects(self):
+        self.trip('douyin')
+        with self.assertRaises(UpstreamUnavailable) as ctx:
+            self.limiter.acquire('douyin')
+        self.assertEqual(ctx.exception.reason, 'circuit open')
+        # 其他平台不受影响
+        with self.limiter.permit('tiktok'):
+            self.limiter.record('tiktok')
+
+    def test_probe_without_record_releases_slot(self):
+        self.half_open('douyin')
+        with self.limiter.permit('douyin'):
+            pass
+        self.assertEqual(self.limiter.snapshot()['douyin']['state'], CircuitBreaker.HALF_OPEN)
+        # 下一个请求可以继续探测
+        with self.limiter.permit('douyin'):
+            self.limiter.record('douyin')
+        self.assertEqual(self.limiter.snapshot()['douyin']['state'], CircuitBreaker.CLOSED)
+
+    def test_probe_exception_releases_slot(self):
+        self.half_open('douyin')
+        with self.assertRaises(RuntimeError):
+            with self.limiter.permit('douyin'):
+                raise RuntimeError('boom')
+        with self.limiter.permit('douyin'):
+            pass
+
+    def test_concurrent_request_during_probe_is_rejected(self):
+        self.half_open('douyin')
+        with self.limiter.permit('douyin'):
+            with self.assertRaises(UpstreamUnavailable):
+                self.limiter.acquire('douyin')
+
+    def test_non_probe_release_keeps_probe_slot(self):
+        # 熔断前发出的慢请求结束时，不应释放之后的探测名额
+        slow = self.limiter.permit('douyin')
+        slow.__enter__()
+        self.half_open('douyin')
+        self.limiter.acquire('douyin')
+        slow.__exit__(None, None, None)
+        with self.assertRaises(UpstreamUnavailable):
+            self.limiter.acquire('douyin')
+
+    def test_probe_connection_error_reopens(self):
+        self.half_open('douyin')
+        with self.limiter.permit('douyin'):
+            self.limiter.record('douyin', ConnectionError('connection refused'))
+        self.assertEqual(self.limiter.snapshot()['douyin']['state'], CircuitBreaker.OPEN)
+
+    def test_probe_ordinary_failure_closes(self):
+        self.half_open('douyin')
+        with self.limiter.permit('douyin'):
+            self.limiter.record('douyin', ValueError('video not found'))
+        self.assertEqual(self.limiter.snapshot()['douyin']['state'], CircuitBreaker.CLOSED)
+
+    def test_throttle_halves_rate(self):
+        with self.limiter.permit('youtube'):
+            self.limiter.record('youtube', 429)
+        self.assertEqual(self.limiter.snapshot()['youtube']['rate'], 50.0)
+
+    def test_empty_bucket_rejects(self):
+        limiter = PlatformLimiter({'default': {'rate': 1.0, 'burst': 1}})
+        limiter.acquire('youtube')
+        with self.assertRaises(UpstreamUnavailable) as ctx:
+            limiter.acquire('youtube')
+        self.assertEqual(ctx.exception.reason, 'rate limited')
+
+    def test_queues_when_token_arrives_within_max_wait(self):
+        limiter = PlatformLimiter({'default': {'rate': 1.0, 'burst': 1}})
+        limiter.acquire('youtube')
+        with mock.patch('rate_limiter.time.sleep', side_effect=lambda wait: setattr(
+                self.clock, 'now', self.clock.now + wait)) as sleep:
+            limiter.acquire('youtube', max_wait=2)
+        sleep.assert_called_once()
+        stats = limiter.snapshot()['youtube']['stats']
+        self.assertEqual((stats['allowed'], stats['queued'], stats['rejected']), (2, 1, 0))
+
+    def test_rejects_when_wait_exceeds_max_wait(self):
+        limiter = PlatformLimiter({'default': {'rate': 1.0, 'burst': 1}})
+        limiter.acquire('youtube')
+        with mock.patch('rate_limiter.time.sleep') as sleep:
+            with self.assertRaises(UpstreamUnavailable) as ctx:
+                limiter.acquire('youtube', max_wait=0.5)
+        sleep.assert_not_called()
+        self.assertEqual(ctx.exception.reason, 'rate limited')
+
+    def test_open_circuit_is_not_queued(self):
+        self.trip('douyin')
+        with mock.patch('rate_limiter.time.sleep') as sleep:
+            with self.assertRaises(UpstreamUnavailable):
+                self.limiter.acquire('douyin', max_wait=10000)
+        sleep.assert_not_called()
+
+    def test_sites_are_isolated(self):
+        self.trip('other:a.example')
+        with self.limiter.permit('other:b.example'):
+            self.limiter.record('other:b.example')
+
+    def test_site_limits_fall_back_to_group(self):
+        limiter = PlatformLimiter({'default': {'rate': 100.0, 'burst': 100}, 'other': {'rate': 1.0, 'burst': 1}})
+        limiter.acquire('other:a.example')
+        with self.assertRaises(UpstreamUnavailable):
+            limiter.acquire('other:a.example')
+
+    def test_evicts_idle_sites_but_keeps_open_circuits(self):
+        self.limiter.MAX_SITES = 3
+        self.trip('other:open.example')
+        for host in ('a', 'b', 'c', 'd'):
+            self.limiter.acquire(f'other:{host}.example')
+        tracked = self.limiter.snapshot()
+        self.assertIn('other:open.example', tracked)
+        self.assertNotIn('other:a.example', tracked)
+        self.assertEqual(len([key for key in tracked if ':' in key]), 3)
+
+
+class ClassifyUpstreamErrorTest(unittest.TestCase):
+
+    def test_status_codes(self):
+        self.assertEqual(classify_upstream_error(429), 'rate_limited')
+        self.assertEqual(classify_upstream_error(UpstreamHTTPError(403)), 'forbidden')
+        self.assertEqual(classify_upstream_error(504), 'timeout')
+        self.assertIsNone(classify_upstream_error(404))
+
+    def test_exception_types(self):
+        self.assertEqual(classify_upstream_error(socket.timeout()), 'timeout')
+        self.assertEqual(classify_upstream_error(ConnectionRefusedError()), 'connection')
+        self.assertIsNone(classify_upstream_error(ValueError('video not found')))
+
+    def test_request_budget_is_not_upstream_timeout(self):
+        self.assertIsNone(classify_upstream_error(DeadlineExceeded('request budget of 1s exceeded')))
+        self.assertIsNone(classify_upstream_error(RequestCancelled('client disconnected')))
+        try:
+            try:
+                raise DeadlineExceeded('request budget of 1s exceeded')
+            except DeadlineExceeded as e:
+                raise RuntimeError('ERROR: download failed') from e
+        except RuntimeError as e:
+            self.assertIsNone(classify_upstream_error(e))
+
+    def test_follows_exception_chain(self):
+        try:
+            try:
+                raise UpstreamHTTPError(429)
+            except UpstreamHTTPError as e:
+                raise RuntimeError('wrapped') from e
+        except RuntimeError as e:
+            self.assertEqual(classify_upstream_error(e), 'rate_limited')
+
+    def test_message_fallback(self):
+        self.assertEqual(classify_upstream_error('ERROR: HTTP Error 429: Too Many Requests'), 'rate_limited')
+
+
+if __name__ == '__main__':
+    unittest.main()
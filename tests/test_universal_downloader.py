@@ -0,0 +1,144 @@
+"""
+universal_downloader 的快速解析测试（meta 标签解析使用 tests/fixtures 中的页面），不依赖网络
+"""
+import os
+import unittest
+from unittest import mock
+
+from deadline import Deadline
+from rate_limiter import UpstreamHTTPError
+from universal_downloader import UniversalDownloader
+
+TIKTOK_URL = 'https://www.tiktok.com/@user/video/7301234567890123456'
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class MetaTagTest(unittest.TestCase):
+
+    def test_open_graph_tags(self):
+        tags = UniversalDownloader._parse_meta_tags(load_fixture('opengraph_video.html'))
+        # 属性大小写、单引号、content 写在前面都能识别
+        self.assertEqual(tags['og:title'], 'Tom & Jerry 片段')
+        self.assertEqual(tags['og:image'], 'https://cdn.example.com/cover.jpg')
+        self.assertEqual(tags['og:video:duration'], '95')
+        self.assertEqual(tags['author'], '示例作者')
+        self.assertEqual(tags['description'], '')
+
+    def test_first_value_wins(self):
+        tags = UniversalDownloader._parse_meta_tags(load_fixture('youtube_watch.html'))
+        self.assertEqual(tags['og:image'], 'https://i.ytimg.com/vi/dQw4w9WgXcQ/maxresdefault.jpg')
+        self.assertEqual(tags['duration'], 'PT3M33S')
+
+    def test_schema_author_is_scoped(self):
+        html = load_fixture('youtube_watch.html')
+        # 页面上第一个 itemprop="name" 是视频标题
+        self.assertEqual(UniversalDownloader._parse_meta_tags(html)['name'],
+                         'Rick Astley - Never Gonna Give You Up (Official Music Video)')
+        self.assertEqual(UniversalDownloader._schema_author(html), 'Rick Astley')
+        self.assertEqual(UniversalDownloader._schema_author(load_fixture('opengraph_video.html')), '')
+
+    def test_meta_card_does_not_use_title_as_author(self):
+        # 回归：schema.org 页面的视频标题曾被当作作者
+        downloader = UniversalDownloader()
+        url = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+        with mock.patch.object(downloader, '_http_get', return_value=(200, url, load_fixture('youtube_watch.html'))):
+            card = downloader._card_from_meta(url, 'youtube', Deadline(5))
+        self.assertEqual(card['title'], 'Rick Astley - Never Gonna Give You Up (Official Music Video)')
+        self.assertEqual(card['author'], 'Rick Astley')
+        self.assertEqual(card['duration'], 213)
+
+    def test_only_meta_values_are_unescaped(self):
+        # meta 属性值反转义一次；oEmbed 等 JSON 中的文本原样保留，不会把字面的 "&amp;" 再解码一次
+        tags = UniversalDownloader._parse_meta_tags('<meta property="og:title" content="A &amp;amp; B">')
+        self.assertEqual(tags['og:title'], 'A &amp; B')
+        downloader = UniversalDownloader()
+        with mock.patch.object(downloader, '_card_from_oembed', return_value={'title': 'Q&amp;A 直播'}), \
+                mock.patch.object(downloader, '_card_from_meta', return_value=None):
+            card = downloader.get_card_info(TIKTOK_URL, Deadline(5))
+        self.assertEqual(card['title'], 'Q&amp;A 直播')
+
+    def test_meta_card_skips_media_urls(self):
+        downloader = UniversalDownloader()
+        with mock.patch.object(downloader, '_http_get') as http_get:
+            self.assertIsNone(downloader._card_from_meta('https://cdn.example.com/v/1.mp4?sig=x', 'other', Deadline(5)))
+        http_get.assert_not_called()
+
+
+class ParseHelperTest(unittest.TestCase):
+
+    def test_parse_duration(self):
+        parse = UniversalDownloader._parse_duration
+        self.assertEqual(parse('95'), 95)
+        self.assertEqual(parse(42), 42)
+        self.assertEqual(parse('PT4M13S'), 253)
+        self.assertEqual(parse('PT1H2M3.5S'), 3723)
+        self.assertEqual(parse('P1DT1S'), 86401)
+        self.assertEqual(parse('pt30s'), 30)
+        self.assertEqual(parse(''), 0)
+        self.assertEqual(parse(None), 0)
+        self.assertEqual(parse('3:45'), 0)
+
+    def test_guess_video_id(self):
+        guess = UniversalDownloader._guess_video_id
+        self.assertEqual(guess('https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1'), 'dQw4w9WgXcQ')
+        self.assertEqual(guess('https://youtu.be/dQw4w9WgXcQ'), 'dQw4w9WgXcQ')
+        self.assertEqual(guess('https://www.youtube.com/shorts/abc_DEF-123'), 'abc_DEF-123')
+        self.assertEqual(guess('https://x.com/user/status/1790000000000000000'), '1790000000000000000')
+        self.assertEqual(guess('https://www.instagram.com/reel/C1a2B3c4D5e/'), 'C1a2B3c4D5e')
+        self.assertEqual(guess(TIKTOK_URL), '7301234567890123456')
+
+    def test_guess_video_id_falls_back_to_hash(self):
+        guess = UniversalDownloader._guess_video_id
+        video_id = guess('https://example.com/watch/page')
+        self.assertRegex(video_id, r'^[0-9a-f]{12}$')
+        self.assertEqual(video_id, guess('https://example.com/watch/page'))
+        self.assertNotEqual(video_id, guess('https://example.com/watch/other'))
+
+
+class CardLimiterTest(unittest.TestCase):
+    """各来源共用一次限流许可，只向限流器记录一次结果"""
+
+    def card(self, oembed, meta, ytdlp_flat=None):
+        downloader = UniversalDownloader()
+        sources = {'oembed': oembed, 'meta': meta, 'ytdlp_flat': ytdlp_flat}
+        patches = [
+            mock.patch.object(downloader, f'_card_from_{name}',
+                              side_effect=value if isinstance(value, Exception) else None,
+                              return_value=value)
+            for name, value in sources.items()
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        result = downloader.get_card_info(TIKTOK_URL, Deadline(5))
+        stats = downloader.limiter.snapshot()['tiktok']['stats']
+        return result, {key: value for key, value in stats.items() if value}
+
+    def test_success_is_recorded_once(self):
+        result, stats = self.card({'title': 'oEmbed 标题'}, {'title': 'meta 标题', 'duration': 12})
+        self.assertTrue(result['success'])
+        self.assertEqual(stats, {'success': 1})
+
+    def test_failed_sources_are_recorded_once(self):
+        result, stats = self.card(ConnectionError('reset'), ConnectionError('reset'), ConnectionError('reset'))
+        self.assertFalse(result['success'])
+        self.assertEqual(stats, {'failure': 1, 'connection': 1})
+
+    def test_worst_throttle_kind_is_recorded(self):
+        result, stats = self.card(ConnectionError('reset'), UpstreamHTTPError(429))
+        self.assertEqual(result['error_code'], 'rate_limited')
+        self.assertEqual(stats, {'failure': 1, 'rate_limited': 1})
+
+    def test_login_wall_falls_through_without_failure(self):
+        result, stats = self.card(UpstreamHTTPError(403), {'title': 'meta 标题'})
+        self.assertEqual(result['title'], 'meta 标题')
+        self.assertEqual(stats, {'success': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,26 +2,84 @@
 通用视频下载器 - 支持多平台
 使用 yt-dlp 实现，支持 Instagram、YouTube、Twitter/X、Facebook 等 1000+ 平台
 抖音使用 curl_cffi 模拟浏览器访问移动端页面
+
+yt-dlp / curl_cffi 在第一次使用时才导入；gunicorn --preload 部署时可在 fork 前调用 warmup()
 """
 import os
+import glob
 import time
 import uuid
 import re
 import json
+import math
+import hashlib
+import html as html_lib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, Tuple
-from urllib.parse import unquote
+from urllib.parse import unquote, quote, urlparse
+
+import profiler
+from deadline import Deadline, DeadlineExceeded, RequestCancelled
+from rate_limiter import (
+    PlatformLimiter, UpstreamUnavailable, UpstreamHTTPError, THROTTLE_KINDS, classify_upstream_error,
+)
+
+# 已导入的后端模块，未安装时值为 None
+_backends: Dict[str, Any] = {}
+
+# warmup() 预加载的 yt-dlp 提取器
+WARMUP_EXTRACTORS = ['TikTok', 'Instagram', 'Youtube', 'Twitter', 'Facebook', 'BiliBili', 'Weibo', 'Generic']
+
+
+def _load_yt_dlp():
+    """按需导入 yt-dlp"""
+    if 'yt_dlp' not in _backends:
+        try:
+            import yt_dlp
+        except ImportError:
+            yt_dlp = None
+        _backends['yt_dlp'] = yt_dlp
+    return _backends['yt_dlp']
+
+
+def _load_curl_cffi():
+    """按需导入 curl_cffi 的 requests 接口"""
+    if 'curl_cffi' not in _backends:
+        try:
+            from curl_cffi import requests as cffi_requests
+        except ImportError:
+            cffi_requests = None
+        _backends['curl_cffi'] = cffi_requests
+    return _backends['curl_cffi']
 
-try:
-    import yt_dlp
-except ImportError:
-    yt_dlp = None
 
-try:
-    from curl_cffi import requests as cffi_requests
-    _has_curl_cffi = True
-except ImportError:
-    _has_curl_cffi = False
-    import requests
+class _DeadlineLogger:
+    """
+    yt-dlp 日志适配器
+    设置 logger 后 yt-dlp 的每条进度消息都会经过 debug()，借此作为检查点中断超时或已取消的提取
+    """
+    
+    def __init__(self, deadline: Deadline, quiet: bool = True, no_warnings: bool = True) -> None:
+        self.deadline = deadline
+        self.quiet = quiet
+        self.no_warnings = no_warnings
+    
+    def debug(self, msg: str) -> None:
+        self.deadline.check()
+        if not self.quiet:
+            print(msg)
+    
+    def info(self, msg: str) -> None:
+        self.debug(msg)
+    
+    def warning(self, msg: str) -> None:
+        if not self.no_warnings:
+            print(msg)
+    
+    def error(self, msg: str) -> None:
+        print(msg)
 
 
 class UniversalDownloader:
@@ -36,6 +94,8 @@ class UniversalDownloader:
                 r'vm\.tiktok\.com',
             ],
             'icon': '🎵',
+            'oembed': 'https://www.tiktok.com/oembed?url={url}',
+            'card_sources': ['oembed', 'meta'],
         },
         'douyin': {
             'name': '抖音',
@@ -61,6 +121,9 @@ class UniversalDownloader:
                 r'youtu\.be',
             ],
             'icon': '🎬',
+            'oembed': 'https://www.youtube.com/oembed?format=json&url={url}',
+            # 页面 meta 中有时长，oEmbed 没有
+            'card_sources': ['meta', 'oembed'],
         },
         'twitter': {
             'name': 'Twitter/X',
@@ -69,6 +132,8 @@ class UniversalDownloader:
                 r'x\.com',
             ],
             'icon': '🐦',
+            'oembed': 'https://publish.twitter.com/oembed?omit_script=1&url={url}',
+            'card_sources': ['oembed'],
         },
         'facebook': {
             'name': 'Facebook',
@@ -86,6 +151,7 @@ class UniversalDownloader:
                 r'b23\.tv',
             ],
             'icon': '📺',
+            'card_sources': ['bilibili_api', 'meta'],
         },
         'weibo': {
             'name': '微博',
@@ -97,9 +163,42 @@ class UniversalDownloader:
         },
     }
     
+    # 默认请求预算（秒），调用方未传入 deadline 时使用
+    PARSE_BUDGET = 30
+    DOWNLOAD_BUDGET = 300
+    # 令牌不足时最多排队等待的秒数（不超过剩余预算），超出则返回 503
+    QUEUE_WAIT = 2.0
+    # 单次网络操作的最大超时，yt-dlp 的 socket_timeout 也取该值与剩余预算的较小值
+    SOCKET_TIMEOUT = 15
+    # 下载中止后最多等待被放弃的后台线程多久再清理文件（yt-dlp 最多重试 3 次，每次受 SOCKET_TIMEOUT 限制）
+    ABANDONED_JOIN_TIMEOUT = SOCKET_TIMEOUT * 8
+    
+    # 解析请求使用的桌面浏览器请求头（yt-dlp 提取和快速解析共用）
+    BROWSER_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept-Language': 'en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7',
+    }
+    
+    # 快速解析未配置 card_sources 的平台时使用页面 meta 标签
+    DEFAULT_CARD_SOURCES = ['meta']
+    # 快速解析单次请求最多读取的字节数（页面 meta 标签最多扫描这么多）
+    META_SCAN_CHARS = 2 * 1024 * 1024
+    # 快速解析后是否在后台预解析完整格式
+    PREFETCH_FULL = os.environ.get('PARSE_PREFETCH', '0') == '1'
+    
+    # 解析结果缓存
+    CACHE_TTL = 600
+    CACHE_STALE_TTL = 3600
+    CACHE_MAX_SIZE = 512
+    
     def __init__(self, download_dir: str = "downloads") -> None:
         self.download_dir = download_dir
-        os.makedirs(self.download_dir, exist_ok=True)
+        # 按平台限流 + 熔断
+        self.limiter = PlatformLimiter()
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._prefetch_pool: Optional[ThreadPoolExecutor] = None
+        self._prefetching = set()
     
     def detect_platform(self, url: str) -> Tuple[str, str]:
         """
@@ -117,6 +216,17 @@ class UniversalDownloader:
         
         return 'other', '其他平台'
     
+    @staticmethod
+    def _limiter_key(url: str, platform_key: str) -> str:
+        """
+        限流器的分组键
+        未识别的站点按域名分组，避免某个站点返回 403 时熔断所有通用链接
+        """
+        if platform_key != 'other':
+            return platform_key
+        host = urlparse(url).hostname
+        return f'other:{host}' if host else platform_key
+    
     def get_supported_platforms(self) -> list:
         """获取所有支持的平台列表"""
         return [
@@ -168,48 +278,84 @@ class UniversalDownloader:
             r'https?://[^\s<>"]+',
         ]
         
-        for pattern in url_patterns:
-            match = re.search(pattern, text)
-            if match:
-                url = match.group(0)
-                # 清理 URL 末尾可能的标点符号
-                url = url.rstrip('.,;:!?\'\"')
-                print(f"从文本中提取到 URL: {url}")
-                return url
+        with profiler.stage('extract_url'):
+            for pattern in url_patterns:
+                match = re.search(pattern, text)
+                if match:
+                    url = match.group(0)
+                    # 清理 URL 末尾可能的标点符号
+                    url = url.rstrip('.,;:!?\'\"')
+                    print(f"从文本中提取到 URL: {url}")
+                    return url
         
         # 如果没有匹配到任何 URL 模式，返回原始文本（可能本身就是 URL）
         return text.strip()
     
-    def _resolve_douyin_url(self, url: str) -> str:
+    def _douyin_get(self, url: str, deadline: Deadline, headers: Optional[Dict[str, str]] = None,
+                    read_body: bool = True) -> Tuple[int, str, str]:
+        """
+        请求抖音页面，返回 (状态码, 重定向后的 URL, 页面内容)
+        整个请求在后台线程中执行，最多等待剩余预算；requests 的 timeout 只限制单次读取，因此逐块读取并检查总预算
+        """
+        timeout = deadline.timeout(cap=self.SOCKET_TIMEOUT)
+        cffi_requests = _load_curl_cffi()
+        
+        def fetch() -> Tuple[int, str, str]:
+            if cffi_requests:
+                session = cffi_requests.Session(impersonate='chrome120')
+                resp = session.get(url, headers=headers, allow_redirects=True, timeout=timeout)
+                return resp.status_code, str(resp.url), resp.text if read_body else ''
+            import requests
+            with requests.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True) as resp:
+                chunks = []
+                if read_body:
+                    for chunk in resp.iter_content(chunk_size=16384):
+                        deadline.check()
+                        chunks.append(chunk)
+                return resp.status_code, resp.url, b''.join(chunks).decode(resp.encoding or 'utf-8', errors='replace')
+        
+        return deadline.call(fetch)
+    
+    def _resolve_douyin_url(self, url: str, deadline: Deadline) -> str:
         """解析抖音短链接，获取视频ID"""
         try:
-            if _has_curl_cffi:
-                session = cffi_requests.Session(impersonate='chrome120')
-                resp = session.get(url, allow_redirects=True)
-            else:
-                resp = requests.get(url, allow_redirects=True, headers={
+            with profiler.stage('douyin_resolve'):
+                # 只需要重定向后的地址，不读取页面内容
+                _, final_url, _ = self._douyin_get(url, deadline, headers={
                     'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X)'
-                })
-            final_url = str(resp.url)
+                }, read_body=False)
             match = re.search(r'/video/(\d+)', final_url)
             if match:
                 return match.group(1)
+        except (DeadlineExceeded, RequestCancelled):
+            raise
         except Exception as e:
             print(f"[抖音] 解析短链接失败: {e}")
+            self.limiter.record('douyin', e)
         return None
     
-    def _get_douyin_video_info(self, url: str) -> Dict[str, Any]:
+    def _get_douyin_video_info(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         通过移动端页面获取抖音视频信息
         使用 curl_cffi 模拟浏览器访问 m.douyin.com
         """
-        # 提取视频ID
-        video_id = None
-        match = re.search(r'/video/(\d+)', url)
-        if match:
-            video_id = match.group(1)
-        else:
-            video_id = self._resolve_douyin_url(url)
+        deadline = deadline or Deadline(self.PARSE_BUDGET)
+        
+        try:
+            # 提取视频ID
+            video_id = None
+            match = re.search(r'/video/(\d+)', url)
+            if match:
+                video_id = match.group(1)
+            else:
+                video_id = self._resolve_douyin_url(url, deadline)
+        except RequestCancelled:
+            self.limiter.release('douyin')
+            return self._error_response("请求已取消", error_code='cancelled')
+        except DeadlineExceeded:
+            # 请求预算耗尽不代表平台异常，不计入限流器
+            self.limiter.release('douyin')
+            return self._error_response("抖音响应超时，请稍后重试", error_code='upstream_timeout')
         
         if not video_id:
             return self._error_response("无法提取抖音视频ID")
@@ -218,11 +364,6 @@ class UniversalDownloader:
         
         try:
             # 访问移动端页面
-            if _has_curl_cffi:
-                session = cffi_requests.Session(impersonate='chrome120')
-            else:
-                session = None
-                
             mobile_url = f'https://m.douyin.com/share/video/{video_id}'
             headers = {
                 'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1',
@@ -230,102 +371,118 @@ class UniversalDownloader:
                 'Accept-Language': 'zh-CN,zh;q=0.9',
             }
             
-            if session:
-                mobile_resp = session.get(mobile_url, headers=headers)
-            else:
-                mobile_resp = requests.get(mobile_url, headers=headers)
+            with profiler.stage('douyin_fetch'):
+                status_code, _, html = self._douyin_get(mobile_url, deadline, headers)
             
-            html = mobile_resp.text
-            print(f"[抖音] 获取移动端页面: {len(html)} 字节")
+            if status_code in (403, 429):
+                self.limiter.record('douyin', status_code)
+                return self._error_response(f"抖音访问受限 (HTTP {status_code})，请稍后重试",
+                                            error_code='rate_limited')
             
-            # 从 script 标签中提取视频数据
-            scripts = re.findall(r'<script[^>]*>(.*?)</script>', html, re.DOTALL)
+            print(f"[抖音] 获取移动端页面: {len(html)} 字节")
             
-            for script in scripts:
-                if 'play_addr' not in script:
-                    continue
+            with profiler.stage('douyin_parse'):
+                # 从 script 标签中提取视频数据
+                scripts = re.findall(r'<script[^>]*>(.*?)</script>', html, re.DOTALL)
                 
-                # 提取各字段
-                title = ''
-                author = ''
-                video_url = ''
-                cover_url = ''
-                duration = 0
-                like_count = 0
-                comment_count = 0
-                share_count = 0
-                
-                # 标题
-                desc_match = re.search(r'"desc"\s*:\s*"((?:[^"\\]|\\.)*)"', script)
-                if desc_match:
-                    title = self._decode_unicode_text(desc_match.group(1))
-                
-                # 作者
-                nick_match = re.search(r'"nickname"\s*:\s*"((?:[^"\\]|\\.)*)"', script)
-                if nick_match:
-                    author = self._decode_unicode_text(nick_match.group(1))
-                
-                # 视频播放地址
-                play_match = re.search(r'"play_addr"\s*:\s*\{[^}]*"url_list"\s*:\s*\["((?:[^"\\]|\\.)*)"', script)
-                if play_match:
-                    video_url = play_match.group(1).replace('\\u002F', '/').replace('playwm', 'play')
-                
-                # 封面图
-                cover_match = re.search(r'"cover"\s*:\s*\{[^}]*"url_list"\s*:\s*\["((?:[^"\\]|\\.)*)"', script)
-                if cover_match:
-                    cover_url = cover_match.group(1).replace('\\u002F', '/')
-                
-                # 时长
-                dur_match = re.search(r'"duration"\s*:\s*(\d+)', script)
-                if dur_match:
-                    duration = int(dur_match.group(1))
-                    # 抖音duration是毫秒，转为秒
-                    if duration > 1000:
-                        duration = duration // 1000
-                
-                # 统计数据
-                like_match = re.search(r'"digg_count"\s*:\s*(\d+)', script)
-                if like_match:
-                    like_count = int(like_match.group(1))
-                
-                comment_match = re.search(r'"comment_count"\s*:\s*(\d+)', script)
-                if comment_match:
-                    comment_count = int(comment_match.group(1))
-                
-                share_match = re.search(r'"share_count"\s*:\s*(\d+)', script)
-                if share_match:
-                    share_count = int(share_match.group(1))
-                
-                if title or video_url:
-                    print(f"[抖音] 成功解析: {title[:50]}")
-                    print(f"[抖音] 作者: {author}")
-                    print(f"[抖音] 视频URL: {'已获取' if video_url else '无'}")
+                for script in scripts:
+                    if 'play_addr' not in script:
+                        continue
+                    
+                    # 提取各字段
+                    title = ''
+                    author = ''
+                    video_url = ''
+                    cover_url = ''
+                    duration = 0
+                    like_count = 0
+                    comment_count = 0
+                    share_count = 0
+                    
+                    # 标题
+                    desc_match = re.search(r'"desc"\s*:\s*"((?:[^"\\]|\\.)*)"', script)
+                    if desc_match:
+                        title = self._decode_unicode_text(desc_match.group(1))
+                    
+                    # 作者
+                    nick_match = re.search(r'"nickname"\s*:\s*"((?:[^"\\]|\\.)*)"', script)
+                    if nick_match:
+                        author = self._decode_unicode_text(nick_match.group(1))
                     
-                    return {
-                        "success": True,
-                        "platform": "douyin",
-                        "platform_name": "抖音",
-                        "video_id": video_id,
-                        "title": title or f"抖音视频 {video_id}",
-                        "author": author or "未知作者",
-                        "video_url": video_url,
-                        "cover_url": cover_url,
-                        "duration": duration,
-                        "like_count": like_count,
-                        "comment_count": comment_count,
-                        "view_count": share_count,
-                    }
+                    # 视频播放地址
+                    play_match = re.search(r'"play_addr"\s*:\s*\{[^}]*"url_list"\s*:\s*\["((?:[^"\\]|\\.)*)"', script)
+                    if play_match:
+                        video_url = play_match.group(1).replace('\\u002F', '/').replace('playwm', 'play')
+                    
+                    # 封面图
+                    cover_match = re.search(r'"cover"\s*:\s*\{[^}]*"url_list"\s*:\s*\["((?:[^"\\]|\\.)*)"', script)
+                    if cover_match:
+                        cover_url = cover_match.group(1).replace('\\u002F', '/')
+                    
+                    # 时长
+                    dur_match = re.search(r'"duration"\s*:\s*(\d+)', script)
+                    if dur_match:
+                        duration = int(dur_match.group(1))
+                        # 抖音duration是毫秒，转为秒
+                        if duration > 1000:
+                            duration = duration // 1000
+                    
+                    # 统计数据
+                    like_match = re.search(r'"digg_count"\s*:\s*(\d+)', script)
+                    if like_match:
+                        like_count = int(like_match.group(1))
+                    
+                    comment_match = re.search(r'"comment_count"\s*:\s*(\d+)', script)
+                    if comment_match:
+                        comment_count = int(comment_match.group(1))
+                    
+                    share_match = re.search(r'"share_count"\s*:\s*(\d+)', script)
+                    if share_match:
+                        share_count = int(share_match.group(1))
+                    
+                    if title or video_url:
+                        self.limiter.record('douyin')
+                        print(f"[抖音] 成功解析: {title[:50]}")
+                        print(f"[抖音] 作者: {author}")
+                        print(f"[抖音] 视频URL: {'已获取' if video_url else '无'}")
+                        
+                        return {
+                            "success": True,
+                            "platform": "douyin",
+                            "platform_name": "抖音",
+                            "video_id": video_id,
+                            "title": title or f"抖音视频 {video_id}",
+                            "author": author or "未知作者",
+                            "video_url": video_url,
+                            "cover_url": cover_url,
+                            "duration": duration,
+                            "like_count": like_count,
+                            "comment_count": comment_count,
+                            "view_count": share_count,
+                        }
             
+            self.limiter.record('douyin', "无法从页面提取视频数据")
             return self._error_response("无法从页面提取视频数据")
             
+        except RequestCancelled:
+            self.limiter.release('douyin')
+            return self._error_response("请求已取消", error_code='cancelled')
+        except DeadlineExceeded:
+            self.limiter.release('douyin')
+            return self._error_response("抖音响应超时，请稍后重试", error_code='upstream_timeout')
         except Exception as e:
             print(f"[抖音] 解析错误: {e}")
+            if self.limiter.record('douyin', e) == 'timeout':
+                return self._error_response("抖音响应超时，请稍后重试", error_code='upstream_timeout')
             return self._error_response(f"抖音解析错误: {str(e)}")
     
-    def get_video_info(self, url: str) -> Dict[str, Any]:
+    def get_video_info(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         获取视频信息
         """
+        deadline = deadline or Deadline(self.PARSE_BUDGET)
+        
+        yt_dlp = _load_yt_dlp()
         if not yt_dlp:
             return self._error_response("yt-dlp 未安装，请运行: pip install yt-dlp")
         
@@ -333,16 +490,14 @@ class UniversalDownloader:
             return self._error_response("请提供视频链接")
         
         platform_key, platform_name = self.detect_platform(url)
+        limiter_key = self._limiter_key(url, platform_key)
         
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
             'extract_flat': False,
             'skip_download': True,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept-Language': 'en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7',
-            },
+            'http_headers': dict(self.BROWSER_HEADERS),
         }
         
         # 抖音需要 cookies 认证
@@ -350,13 +505,17 @@ class UniversalDownloader:
             ydl_opts['cookiesfrombrowser'] = ('chrome',)
         
         try:
+            self._apply_deadline(ydl_opts, deadline)
             print(f"[{platform_name}] 正在解析: {url}")
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+                info = deadline.call(profiler.traced('ytdlp_extract', ydl.extract_info), url, download=False)
                 
                 if not info:
+                    self.limiter.record(limiter_key, "无法获取视频信息")
                     return self._error_response("无法获取视频信息")
                 
+                self.limiter.record(limiter_key)
+                
                 # 提取视频 URL
                 video_url = self._extract_best_video_url(info)
                 
@@ -376,16 +535,311 @@ class UniversalDownloader:
                 }
                 
         except Exception as e:
+            e = self._deadline_error(e, deadline)
+            if isinstance(e, RequestCancelled):
+                self.limiter.release(limiter_key)
+                return self._error_response("请求已取消", error_code='cancelled')
+            if isinstance(e, DeadlineExceeded):
+                # 请求预算耗尽（客户端可通过 X-Request-Timeout 缩短）不代表平台异常，不计入限流器
+                self.limiter.release(limiter_key)
+                return self._error_response(f"{platform_name} 响应超时，请稍后重试", error_code='upstream_timeout')
+            
             error_msg = str(e)
             print(f"[{platform_name}] 解析失败: {error_msg}")
             
-            # 提供更友好的错误信息
-            if 'login' in error_msg.lower() or 'private' in error_msg.lower():
-                return self._error_response(f"该视频可能是私密内容或需要登录才能查看")
-            elif 'not found' in error_msg.lower() or '404' in error_msg:
-                return self._error_response(f"视频不存在或已被删除")
+            # 根据状态码 / 异常类型判断是否被限流
+            kind = self.limiter.record(limiter_key, e)
+            if kind == 'rate_limited':
+                return self._error_response(f"{platform_name} 请求过于频繁，请稍后重试", error_code='rate_limited')
+            elif kind == 'timeout':
+                return self._error_response(f"{platform_name} 响应超时，请稍后重试", error_code='upstream_timeout')
+            
+            return self._error_response(self._ytdlp_error_message(error_msg))
+    
+    @staticmethod
+    def _ytdlp_error_message(error_msg: str) -> str:
+        """把 yt-dlp 的错误转换为更友好的提示"""
+        if 'login' in error_msg.lower() or 'private' in error_msg.lower():
+            return "该视频可能是私密内容或需要登录才能查看"
+        elif 'not found' in error_msg.lower() or '404' in error_msg:
+            return "视频不存在或已被删除"
+        else:
+            return f"解析失败: {error_msg[:100]}"
+    
+    def _http_get(self, url: str, deadline: Deadline, headers: Optional[Dict[str, str]] = None,
+                  content_type: Optional[str] = None) -> Tuple[int, str, str]:
+        """
+        轻量 HTTP GET（快速解析使用），返回 (状态码, 重定向后的 URL, 响应正文)，被限流时抛出 UpstreamHTTPError
+        Content-Type 不包含 content_type 时不读取正文（例如没有扩展名的视频直链）；正文最多读取 META_SCAN_CHARS 字节
+        整个请求在后台线程中执行，最多等待剩余预算；requests 的 timeout 只限制单次读取，因此逐块读取并检查总预算
+        """
+        headers = headers or self.BROWSER_HEADERS
+        timeout = deadline.timeout(cap=self.SOCKET_TIMEOUT)
+        cffi_requests = _load_curl_cffi()
+        
+        def fetch() -> Tuple[int, str, str]:
+            if cffi_requests:
+                resp = cffi_requests.get(url, headers=headers, timeout=timeout, stream=True,
+                                         allow_redirects=True, impersonate='chrome120')
             else:
-                return self._error_response(f"解析失败: {error_msg[:100]}")
+                import requests
+                resp = requests.get(url, headers=headers, timeout=timeout, stream=True, allow_redirects=True)
+            try:
+                if resp.status_code in (403, 429):
+                    raise UpstreamHTTPError(resp.status_code, url)
+                resp_type = resp.headers.get('Content-Type', '')
+                if content_type and resp_type and content_type not in resp_type.lower():
+                    return resp.status_code, str(resp.url), ''
+                chunks, size = [], 0
+                for chunk in resp.iter_content(chunk_size=16384):
+                    deadline.check()
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.META_SCAN_CHARS:
+                        break
+                body = b''.join(chunks)
+                charset = re.search(r'charset=["\']?([\w-]+)', resp_type, re.IGNORECASE)
+                encoding = charset.group(1) if charset else 'utf-8'
+                try:
+                    text = body[:self.META_SCAN_CHARS].decode(encoding, errors='replace')
+                except LookupError:
+                    text = body[:self.META_SCAN_CHARS].decode('utf-8', errors='replace')
+                return resp.status_code, str(resp.url), text
+            finally:
+                resp.close()
+        
+        return deadline.call(fetch)
+    
+    def _card_from_oembed(self, url: str, platform_key: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+        """oEmbed 接口：标题、作者、封面"""
+        endpoint = self.PLATFORMS.get(platform_key, {}).get('oembed')
+        if not endpoint:
+            return None
+        status_code, _, body = self._http_get(endpoint.format(url=quote(url, safe='')), deadline)
+        if status_code != 200:
+            return None
+        data = json.loads(body)
+        title = data.get('title', '')
+        if not title and data.get('html'):
+            # Twitter 的 oEmbed 没有 title，取嵌入 HTML 中的正文
+            text_match = re.search(r'<p[^>]*>(.*?)</p>', data['html'], re.DOTALL)
+            if text_match:
+                title = html_lib.unescape(re.sub(r'<[^>]+>', '', text_match.group(1))).strip()
+        return {
+            "title": title,
+            "author": data.get('author_name', ''),
+            "cover_url": data.get('thumbnail_url', ''),
+        }
+    
+    def _card_from_meta(self, url: str, platform_key: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+        """页面 meta 标签（Open Graph / Twitter Card / schema.org）"""
+        # 直链媒体文件没有 meta 标签，不要把整个文件拉下来
+        if re.search(r'\.(?:mp4|m3u8|webm|mov|flv|mkv|mp3|m4a)(?:\?|$)', url, re.IGNORECASE):
+            return None
+        # 非 HTML 响应（没有扩展名的媒体直链等）不读取正文
+        status_code, final_url, html = self._http_get(url, deadline, content_type='html')
+        if status_code != 200 or not html:
+            return None
+        tags = self._parse_meta_tags(html)
+        duration = tags.get('og:video:duration') or tags.get('video:duration') or tags.get('duration', '')
+        return {
+            "title": tags.get('og:title') or tags.get('twitter:title', ''),
+            "author": tags.get('author') or self._schema_author(html) or tags.get('og:video:director', ''),
+            "cover_url": tags.get('og:image') or tags.get('twitter:image', ''),
+            "duration": self._parse_duration(duration),
+            "final_url": final_url,
+        }
+    
+    def _card_from_bilibili_api(self, url: str, platform_key: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+        """B站视频信息接口（只返回元数据，不含播放地址）"""
+        match = re.search(r'/video/(BV[0-9A-Za-z]+|av\d+)', url, re.IGNORECASE)
+        if not match:
+            return None
+        video_key = match.group(1)
+        if video_key.lower().startswith('av'):
+            api_url = f'https://api.bilibili.com/x/web-interface/view?aid={video_key[2:]}'
+        else:
+            api_url = f'https://api.bilibili.com/x/web-interface/view?bvid={video_key}'
+        status_code, _, body = self._http_get(api_url, deadline)
+        data = json.loads(body).get('data') if status_code == 200 else None
+        if not data:
+            return None
+        stat = data.get('stat') or {}
+        return {
+            "video_id": data.get('bvid', video_key),
+            "title": data.get('title', ''),
+            "author": (data.get('owner') or {}).get('name', ''),
+            "cover_url": data.get('pic', ''),
+            "duration": data.get('duration', 0),
+            "like_count": stat.get('like', 0),
+            "view_count": stat.get('view', 0),
+            "comment_count": stat.get('reply', 0),
+        }
+    
+    def _card_from_ytdlp_flat(self, url: str, platform_key: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+        """yt-dlp 只运行提取器，不做格式选择 / 处理（process=False）"""
+        yt_dlp = _load_yt_dlp()
+        if not yt_dlp:
+            return None
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'skip_download': True,
+            'http_headers': dict(self.BROWSER_HEADERS),
+        }
+        self._apply_deadline(ydl_opts, deadline)
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = deadline.call(profiler.traced('ytdlp_flat', ydl.extract_info), url,
+                                 download=False, process=False)
+        if not info:
+            return None
+        thumbnails = info.get('thumbnails') or []
+        return {
+            "video_id": info.get('id', ''),
+            "title": (info.get('title') or info.get('description') or '')[:200],
+            "author": info.get('uploader') or info.get('channel') or info.get('creator') or '',
+            "cover_url": info.get('thumbnail') or (thumbnails[-1].get('url', '') if thumbnails else ''),
+            "duration": info.get('duration') or 0,
+            "like_count": info.get('like_count') or 0,
+            "view_count": info.get('view_count') or 0,
+            "comment_count": info.get('comment_count') or 0,
+        }
+    
+    def get_card_info(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        快速获取卡片信息（标题、作者、封面、时长），不解析播放格式
+        依次尝试平台配置的轻量来源，仍缺少标题时回退到 yt-dlp 不处理格式的提取
+        """
+        deadline = deadline or Deadline(self.PARSE_BUDGET)
+        platform_key, platform_name = self.detect_platform(url)
+        limiter_key = self._limiter_key(url, platform_key)
+        sources = self.PLATFORMS.get(platform_key, {}).get('card_sources', self.DEFAULT_CARD_SOURCES)
+        
+        card: Dict[str, Any] = {}
+        # 各来源共用一次限流许可，结束时只记录一次结果：出现过限流类错误时记录最严重的一个，否则记录成功 / 普通失败
+        failure: Optional[Exception] = None
+        failure_rank = len(THROTTLE_KINDS)
+        error_result: Optional[Dict[str, Any]] = None
+        for source in list(sources) + ['ytdlp_flat']:
+            # 轻量来源已经拿到标题时不再动用 yt-dlp
+            if source == 'ytdlp_flat' and card.get('title'):
+                break
+            try:
+                with profiler.stage(f'card_{source}'):
+                    found = getattr(self, f'_card_from_{source}')(url, platform_key, deadline)
+            except RequestCancelled:
+                self.limiter.release(limiter_key)
+                return self._error_response("请求已取消", error_code='cancelled')
+            except Exception as e:
+                e = self._deadline_error(e, deadline)
+                if isinstance(e, RequestCancelled):
+                    self.limiter.release(limiter_key)
+                    return self._error_response("请求已取消", error_code='cancelled')
+                if isinstance(e, DeadlineExceeded):
+                    self.limiter.release(limiter_key)
+                    return self._error_response(f"{platform_name} 响应超时，请稍后重试", error_code='upstream_timeout')
+                print(f"[{platform_name}] 快速解析 {source} 失败: {e}")
+                kind = classify_upstream_error(e)
+                if kind == 'forbidden' and source != 'ytdlp_flat':
+                    # 需要登录的页面（Facebook / Instagram 等）也会返回 403，不算限流，继续尝试下一个来源
+                    continue
+                rank = THROTTLE_KINDS.index(kind) if kind in THROTTLE_KINDS else len(THROTTLE_KINDS)
+                if failure is None or rank < failure_rank:
+                    failure, failure_rank = e, rank
+                if kind == 'timeout':
+                    error_result = self._error_response(f"{platform_name} 响应超时，请稍后重试",
+                                                        error_code='upstream_timeout')
+                    break
+                elif kind == 'rate_limited' and not card.get('title'):
+                    error_result = self._error_response(f"{platform_name} 请求过于频繁，请稍后重试",
+                                                        error_code='rate_limited')
+                    break
+                elif source == 'ytdlp_flat' and not card.get('title'):
+                    # 完整解析使用同一个提取器，回退只会再失败一次
+                    error_result = self._error_response(self._ytdlp_error_message(str(e)),
+                                                        error_code='extract_failed')
+                    break
+                continue
+            for key, value in (found or {}).items():
+                if value and not card.get(key):
+                    card[key] = value
+            if all(card.get(key) for key in ('title', 'author', 'cover_url', 'duration')):
+                break
+        
+        if failure_rank < len(THROTTLE_KINDS) or not card.get('title'):
+            self.limiter.record(limiter_key, failure)
+        else:
+            self.limiter.record(limiter_key)
+        if error_result:
+            return error_result
+        if not card.get('title'):
+            return self._error_response(f"{platform_name} 快速解析失败")
+        
+        final_url = card.pop('final_url', url)
+        return {
+            "success": True,
+            "platform": platform_key,
+            "platform_name": platform_name,
+            "video_id": card.get('video_id') or self._guess_video_id(final_url),
+            "title": card['title'][:200],
+            "author": card.get('author') or '未知作者',
+            "video_url": '',
+            "cover_url": card.get('cover_url', ''),
+            "duration": int(card.get('duration') or 0),
+            "like_count": card.get('like_count', 0),
+            "view_count": card.get('view_count', 0),
+            "comment_count": card.get('comment_count', 0),
+        }
+    
+    @staticmethod
+    def _parse_meta_tags(html: str) -> Dict[str, str]:
+        """提取 <meta>/<link> 标签中的 property/name/itemprop -> content（已反转义），同名取第一个"""
+        tags: Dict[str, str] = {}
+        for tag in re.findall(r'<(?:meta|link)\s[^>]*>', html, re.IGNORECASE):
+            key_match = re.search(r'(?:property|name|itemprop)\s*=\s*["\']([^"\']+)["\']', tag, re.IGNORECASE)
+            value_match = re.search(r'content\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', tag, re.IGNORECASE)
+            if key_match and value_match:
+                key = key_match.group(1).strip().lower()
+                if key not in tags:
+                    value = value_match.group(1) if value_match.group(1) is not None else value_match.group(2)
+                    # 属性值是 HTML 转义过的（&amp; 等），oEmbed / 接口返回的 JSON 不需要再处理
+                    tags[key] = html_lib.unescape(value)
+        return tags
+    
+    @classmethod
+    def _schema_author(cls, html: str) -> str:
+        """
+        schema.org 的作者名（itemprop="author" 范围内的 itemprop="name"）
+        VideoObject 页面上第一个 itemprop="name" 是视频标题，不能直接当作作者
+        """
+        match = re.search(r'<(span|div)\s[^>]*itemprop\s*=\s*["\']author["\'][^>]*>(.*?)</\1>',
+                          html, re.IGNORECASE | re.DOTALL)
+        if not match:
+            return ''
+        return cls._parse_meta_tags(match.group(2)).get('name', '')
+    
+    @staticmethod
+    def _parse_duration(value: Any) -> int:
+        """解析秒数或 ISO 8601 时长（PT4M13S）"""
+        if not value:
+            return 0
+        value = str(value).strip()
+        if value.isdigit():
+            return int(value)
+        match = re.match(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?$', value, re.IGNORECASE)
+        if not match:
+            return 0
+        days, hours, minutes, seconds = match.groups()
+        return int(int(days or 0) * 86400 + int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0))
+    
+    @staticmethod
+    def _guess_video_id(url: str) -> str:
+        """快速解析拿不到 ID 时，从 URL 中推断（用于下载文件名）"""
+        match = re.search(r'(?:v=|/video/|/shorts/|/status/|/reel/|/p/|/videos/|youtu\.be/)([A-Za-z0-9_-]+)', url)
+        if match:
+            return match.group(1)
+        return hashlib.md5(url.encode('utf-8')).hexdigest()[:12]
     
     def _extract_best_video_url(self, info: Dict) -> str:
         """从 yt-dlp 信息中提取最佳视频 URL"""
@@ -418,6 +872,27 @@ class UniversalDownloader:
         
         return ''
     
+    def _apply_deadline(self, ydl_opts: Dict[str, Any], deadline: Deadline) -> None:
+        """让 yt-dlp 遵守请求预算：限制单次 socket 超时，并在日志/进度回调中检查截止时间"""
+        ydl_opts['socket_timeout'] = deadline.timeout(cap=self.SOCKET_TIMEOUT)
+        ydl_opts['logger'] = _DeadlineLogger(
+            deadline,
+            quiet=ydl_opts.get('quiet', False),
+            no_warnings=ydl_opts.get('no_warnings', False),
+        )
+        ydl_opts['progress_hooks'] = ydl_opts.get('progress_hooks', []) + [lambda d: deadline.check()]
+    
+    @staticmethod
+    def _deadline_error(error: Exception, deadline: Deadline) -> Exception:
+        """yt-dlp 可能把检查点抛出的异常包装成 DownloadError，这里还原出真实原因"""
+        if isinstance(error, (DeadlineExceeded, RequestCancelled)):
+            return error
+        try:
+            deadline.check()
+        except (DeadlineExceeded, RequestCancelled) as e:
+            return e
+        return error
+    
     @staticmethod
     def _decode_unicode_text(text: str) -> str:
         """正确解码包含 \\uXXXX 的文本"""
@@ -429,14 +904,19 @@ class UniversalDownloader:
         except Exception:
             return text
     
-    def download_video(self, url: str, filename: Optional[str] = None) -> Optional[str]:
+    def download_video(self, url: str, filename: Optional[str] = None,
+                       deadline: Optional[Deadline] = None) -> Optional[str]:
         """
         下载视频
         支持传入分享文本，会自动提取 URL
+        平台处于熔断/限流状态时抛出 UpstreamUnavailable，
+        超出预算或客户端断开时删除未完成的文件并抛出 DeadlineExceeded / RequestCancelled
         """
         if not url:
             return None
         
+        deadline = deadline or Deadline(self.DOWNLOAD_BUDGET)
+        
         # 从分享文本中提取 URL
         extracted_url = self.extract_url_from_text(url)
         if not extracted_url:
@@ -444,12 +924,20 @@ class UniversalDownloader:
             return None
         url = extracted_url
         
+        yt_dlp = _load_yt_dlp()
         if not yt_dlp:
             print("yt-dlp 未安装")
             return None
         
         platform_key, platform_name = self.detect_platform(url)
-        
+        limiter_key = self._limiter_key(url, platform_key)
+        with self.limiter.permit(limiter_key, min(deadline.remaining(), self.QUEUE_WAIT)):
+            return self._download(url, filename, deadline, yt_dlp, platform_key, platform_name)
+    
+    def _download(self, url: str, filename: Optional[str], deadline: Deadline, yt_dlp: Any,
+                  platform_key: str, platform_name: str) -> Optional[str]:
+        """download_video 取得限流许可之后的下载流程"""
+        limiter_key = self._limiter_key(url, platform_key)
         # 生成文件名
         if not filename:
             timestamp = int(time.time())
@@ -460,6 +948,7 @@ class UniversalDownloader:
             filepath = filename
         else:
             filepath = os.path.join(self.download_dir, filename)
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
         
         if not filepath.endswith('.mp4'):
             filepath = filepath + '.mp4'
@@ -481,43 +970,56 @@ class UniversalDownloader:
         # 抖音使用直接下载视频 URL
         if platform_key == 'douyin':
             # 先解析获取直接视频URL，用 requests 直接下载
-            douyin_info = self._get_douyin_video_info(url)
+            douyin_info = self._get_douyin_video_info(url, deadline)
+            deadline.check()
             if douyin_info.get('success') and douyin_info.get('video_url'):
                 try:
                     video_direct_url = douyin_info['video_url']
                     print(f"[抖音] 使用无水印URL下载: {video_direct_url[:80]}...")
                     
-                    # 先获取重定向后的真实下载地址
-                    if _has_curl_cffi:
-                        session = cffi_requests.Session(impersonate='chrome120')
-                        # 先请求获取重定向地址
-                        head_resp = session.get(video_direct_url, allow_redirects=True, timeout=30)
-                        real_url = str(head_resp.url)
-                        content_length = len(head_resp.content)
-                        
-                        if content_length > 0:
-                            # 直接写入已获取的内容
-                            print(f"[抖音] 文件大小: {content_length / 1024 / 1024:.1f} MB")
-                            with open(filepath, 'wb') as f:
-                                f.write(head_resp.content)
+                    cffi_requests = _load_curl_cffi()
+                    
+                    def fetch_to_file() -> None:
+                        if cffi_requests:
+                            session = cffi_requests.Session(impersonate='chrome120')
+                            # 先请求获取重定向后的真实下载地址
+                            head_resp = session.get(video_direct_url, allow_redirects=True,
+                                                    timeout=deadline.timeout())
+                            real_url = str(head_resp.url)
+                            content_length = len(head_resp.content)
+                            deadline.check()
+                            
+                            if content_length > 0:
+                                # 直接写入已获取的内容
+                                print(f"[抖音] 文件大小: {content_length / 1024 / 1024:.1f} MB")
+                                with open(filepath, 'wb') as f:
+                                    f.write(head_resp.content)
+                            else:
+                                print(f"[抖音] 使用重定向地址下载: {real_url[:80]}...")
+                                resp = session.get(real_url, timeout=deadline.timeout())
+                                deadline.check()
+                                with open(filepath, 'wb') as f:
+                                    f.write(resp.content)
                         else:
-                            print(f"[抖音] 使用重定向地址下载: {real_url[:80]}...")
-                            resp = session.get(real_url, timeout=300)
-                            with open(filepath, 'wb') as f:
-                                f.write(resp.content)
-                    else:
-                        import requests as std_requests
-                        resp = std_requests.get(video_direct_url, 
-                            allow_redirects=True, 
-                            timeout=300,
-                            headers={'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X)'},
-                            stream=True
-                        )
-                        with open(filepath, 'wb') as f:
-                            for chunk in resp.iter_content(chunk_size=65536):
-                                if chunk:
-                                    f.write(chunk)
+                            import requests as std_requests
+                            resp = std_requests.get(video_direct_url, 
+                                allow_redirects=True, 
+                                timeout=deadline.timeout(cap=self.SOCKET_TIMEOUT),
+                                headers={'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X)'},
+                                stream=True
+                            )
+                            with resp, open(filepath, 'wb') as f:
+                                for chunk in resp.iter_content(chunk_size=65536):
+                                    # requests 的 timeout 只限制单次读取，逐块检查总预算
+                                    deadline.check()
+                                    if chunk:
+                                        f.write(chunk)
+                    
+                    # 在后台线程中执行，最多等待剩余预算：上游慢速返回或客户端断开时立即放弃
+                    with profiler.stage('douyin_download'):
+                        deadline.call(fetch_to_file)
                     
+                    # 解析页面时 _get_douyin_video_info 已经记录过成功，这里不再重复记录
                     if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
                         file_size = os.path.getsize(filepath) / 1024 / 1024
                         print(f"[抖音] 下载成功: {filepath} ({file_size:.1f} MB)")
@@ -526,20 +1028,26 @@ class UniversalDownloader:
                         print(f"[抖音] 下载文件为空")
                         return None
                 except Exception as e:
+                    e = self._deadline_error(e, deadline)
+                    if isinstance(e, (DeadlineExceeded, RequestCancelled)):
+                        self._abort_download(limiter_key, e, glob.escape(filepath), deadline)
                     print(f"[抖音] 直接下载失败: {e}")
+                    self.limiter.record('douyin', e)
                     return None
             else:
                 print(f"[抖音] 无法获取视频URL")
                 return None
         
+        # 查找下载的文件
+        base_path = filepath.replace('.mp4', '')
+        
         try:
+            self._apply_deadline(ydl_opts, deadline)
             print(f"[{platform_name}] 正在下载: {url}")
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+                deadline.call(profiler.traced('ytdlp_download', ydl.download), [url])
+            self.limiter.record(limiter_key)
             
-            # 查找下载的文件
-            import glob
-            base_path = filepath.replace('.mp4', '')
             found_files = glob.glob(base_path + '.*')
             
             for found_file in found_files:
@@ -551,24 +1059,94 @@ class UniversalDownloader:
             return None
             
         except Exception as e:
+            e = self._deadline_error(e, deadline)
+            if isinstance(e, (DeadlineExceeded, RequestCancelled)):
+                self._abort_download(limiter_key, e, glob.escape(base_path) + '.*', deadline)
             print(f"[{platform_name}] 下载失败: {e}")
+            self.limiter.record(limiter_key, e)
             return None
     
-    def _error_response(self, error: str) -> Dict[str, Any]:
+    def _abort_download(self, limiter_key: str, error: Exception, pattern: str, deadline: Deadline) -> None:
+        """下载超时或被取消：清理未完成的文件并向上抛出"""
+        self._remove_files(pattern)
+        if deadline.abandoned:
+            # 被放弃的后台线程在下一个检查点之前还可能写入（yt-dlp 会重新创建 .part 文件），等它退出后再清理一次
+            def cleanup() -> None:
+                deadline.join_abandoned(self.ABANDONED_JOIN_TIMEOUT)
+                self._remove_files(pattern)
+            threading.Thread(target=cleanup, daemon=True).start()
+        # 取消和预算耗尽都不代表平台异常，只释放探测名额
+        self.limiter.release(limiter_key)
+        if isinstance(error, RequestCancelled):
+            print(f"[{limiter_key}] 客户端已断开，取消下载")
+        else:
+            print(f"[{limiter_key}] 下载超时: {error}")
+        raise error
+    
+    @staticmethod
+    def _remove_files(pattern: str) -> None:
+        for path in glob.glob(pattern):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def _error_response(self, error: str, **extra: Any) -> Dict[str, Any]:
         """生成错误响应"""
         return {
             "success": False,
             "error": error,
+            **extra,
         }
     
-    def process_url(self, url: str) -> Dict[str, Any]:
+    def _get_cached(self, url: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """读取解析缓存，allow_stale 时允许返回过期但未淘汰的结果"""
+        with self._cache_lock:
+            entry = self._cache.get(url)
+            if not entry:
+                return None
+            cached_at, result = entry
+            age = time.time() - cached_at
+            if age > self.CACHE_STALE_TTL:
+                del self._cache[url]
+                return None
+            if age > self.CACHE_TTL and not allow_stale:
+                return None
+            self._cache.move_to_end(url)
+            return dict(result, cached=True)
+    
+    def _set_cached(self, url: str, result: Dict[str, Any]) -> None:
+        """写入解析缓存（LRU 淘汰）"""
+        with self._cache_lock:
+            self._cache[url] = (time.time(), result)
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.CACHE_MAX_SIZE:
+                self._cache.popitem(last=False)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """限流器与缓存状态"""
+        with self._cache_lock:
+            cache_size = len(self._cache)
+        return {
+            "limiter": self.limiter.snapshot(),
+            "cache": {
+                "size": cache_size,
+                "max_size": self.CACHE_MAX_SIZE,
+                "ttl": self.CACHE_TTL,
+            },
+        }
+    
+    def process_url(self, url: str, deadline: Optional[Deadline] = None, tier: str = 'full') -> Dict[str, Any]:
         """
         处理 URL - 主入口方法
         支持直接传入分享文本，会自动提取 URL
+        tier='fast' 只返回卡片信息（不含播放地址），tier='full' 解析完整格式
         """
         if not url:
             return self._error_response("请提供视频链接")
         
+        deadline = deadline or Deadline(self.PARSE_BUDGET)
+        
         # 从分享文本中提取 URL
         extracted_url = self.extract_url_from_text(url)
         
@@ -576,42 +1154,81 @@ class UniversalDownloader:
             return self._error_response("无法从文本中提取视频链接")
         
         platform_key, platform_name = self.detect_platform(extracted_url)
+        limiter_key = self._limiter_key(extracted_url, platform_key)
         
         if platform_key == 'unknown':
             return self._error_response("无法识别该链接，请检查是否为支持的平台")
         
+        # 完整结果可以直接满足快速解析
+        fast_key = 'fast:' + extracted_url
+        cached = self._get_cached(extracted_url)
+        if not cached and tier == 'fast':
+            cached = self._get_cached(fast_key)
+        if cached:
+            return cached
+        
+        try:
+            with self.limiter.permit(limiter_key, min(deadline.remaining(), self.QUEUE_WAIT)):
+                return self._parse(extracted_url, platform_key, platform_name, deadline, tier)
+        except UpstreamUnavailable as e:
+            # 平台熔断时优先返回过期缓存，否则快速失败
+            stale = self._get_cached(extracted_url, allow_stale=True)
+            if not stale and tier == 'fast':
+                stale = self._get_cached(fast_key, allow_stale=True)
+            if stale:
+                return stale
+            print(f"[{platform_name}] 跳过请求: {e}")
+            return self._error_response(
+                f"{platform_name} 当前访问受限，请 {math.ceil(e.retry_after)} 秒后重试",
+                error_code='upstream_unavailable',
+                retry_after=math.ceil(e.retry_after),
+            )
+    
+    def _parse(self, extracted_url: str, platform_key: str, platform_name: str,
+               deadline: Optional[Deadline], tier: str) -> Dict[str, Any]:
+        """process_url 取得限流许可之后的解析流程"""
+        fast_key = 'fast:' + extracted_url
+        
         # 抖音使用移动端页面解析（绕过 yt-dlp cookies 问题）
         if platform_key == 'douyin':
             print(f"[{platform_name}] 使用移动端页面解析")
-            info = self._get_douyin_video_info(extracted_url)
+            info = self._get_douyin_video_info(extracted_url, deadline)
             
             if info.get('success'):
-                return {
-                    "success": True,
-                    "platform": platform_key,
-                    "platform_name": platform_name,
-                    "video_id": info.get('video_id', 'unknown'),
-                    "video_info": {
-                        "title": info.get('title', '未知标题'),
-                        "author": info.get('author', '未知作者'),
-                        "video_url": info.get('video_url', ''),
-                        "cover_url": info.get('cover_url', ''),
-                        "duration": info.get('duration', 0),
-                        "like_count": info.get('like_count', 0),
-                        "view_count": info.get('view_count', 0),
-                        "comment_count": info.get('comment_count', 0),
-                    },
-                    "has_download_url": bool(info.get('video_url')),
-                }
+                result = self._video_result(platform_key, platform_name, info, 'full')
+                self._set_cached(extracted_url, result)
+                return result
             else:
-                return self._error_response(info.get('error', '抖音解析失败'))
+                return info if info.get('error_code') else self._error_response(info.get('error', '抖音解析失败'))
+        
+        # 快速解析：只取卡片信息，播放格式在下载时（或后台预解析时）再解析
+        if tier == 'fast':
+            info = self.get_card_info(extracted_url, deadline)
+            if info.get('success'):
+                result = self._video_result(platform_key, platform_name, info, 'fast')
+                self._set_cached(fast_key, result)
+                if self.PREFETCH_FULL:
+                    self._prefetch(extracted_url)
+                return result
+            # 取消 / 超时 / 被限流时不再回退，避免继续消耗预算和平台配额
+            if info.get('error_code'):
+                return info
+            print(f"[{platform_name}] 快速解析失败，回退到完整解析")
         
         # 其他平台使用 yt-dlp
-        info = self.get_video_info(extracted_url)
+        info = self.get_video_info(extracted_url, deadline)
         
         if not info.get('success'):
             return info
         
+        result = self._video_result(platform_key, platform_name, info, 'full')
+        self._set_cached(extracted_url, result)
+        return result
+    
+    @staticmethod
+    def _video_result(platform_key: str, platform_name: str, info: Dict[str, Any], tier: str) -> Dict[str, Any]:
+        """由抖音 / 卡片 / yt-dlp 的解析信息生成 process_url 的返回结果"""
+        video_url = info.get('video_url', '')
         return {
             "success": True,
             "platform": platform_key,
@@ -620,16 +1237,85 @@ class UniversalDownloader:
             "video_info": {
                 "title": info.get('title', '未知标题'),
                 "author": info.get('author', '未知作者'),
-                "video_url": info.get('video_url', ''),
+                "video_url": video_url,
                 "cover_url": info.get('cover_url', ''),
                 "duration": info.get('duration', 0),
                 "like_count": info.get('like_count', 0),
                 "view_count": info.get('view_count', 0),
                 "comment_count": info.get('comment_count', 0),
             },
-            "has_download_url": bool(info.get('video_url')),
+            "has_download_url": bool(video_url),
+            "tier": tier,
         }
+    
+    def _prefetch(self, url: str) -> None:
+        """后台解析完整格式并写入缓存，之后的 tier='full' 请求直接命中"""
+        with self._cache_lock:
+            if url in self._prefetching:
+                return
+            self._prefetching.add(url)
+            if self._prefetch_pool is None:
+                self._prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+        
+        def run() -> None:
+            try:
+                self.process_url(url, Deadline(self.PARSE_BUDGET), tier='full')
+            except Exception as e:
+                print(f"[预解析] 失败: {e}")
+            finally:
+                with self._cache_lock:
+                    self._prefetching.discard(url)
+        
+        self._prefetch_pool.submit(run)
+
+
+# 共享实例，由 get_downloader() 在第一次使用时创建
+_shared_downloader: Optional[UniversalDownloader] = None
+_shared_lock = threading.Lock()
+
+
+def get_downloader(download_dir: str = "downloads") -> UniversalDownloader:
+    """获取进程内共享的下载器实例（限流器和解析缓存随实例共享）"""
+    global _shared_downloader
+    if _shared_downloader is None:
+        with _shared_lock:
+            if _shared_downloader is None:
+                _shared_downloader = UniversalDownloader(download_dir)
+    return _shared_downloader
+
+
+def warmup() -> Dict[str, float]:
+    """
+    预先导入 yt-dlp / curl_cffi 并加载常用提取器，返回各步骤耗时（秒）
+    在 gunicorn master 中 fork 之前调用，worker 通过写时复制共享这些内存页，首个请求也不再承担导入开销
+    """
+    timings = {}
+    
+    started = time.perf_counter()
+    yt_dlp = _load_yt_dlp()
+    timings['yt_dlp'] = time.perf_counter() - started
+    
+    if yt_dlp:
+        started = time.perf_counter()
+        ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+        for ie_key in WARMUP_EXTRACTORS:
+            try:
+                ydl.get_info_extractor(ie_key)
+            except Exception as e:
+                print(f"[warmup] 加载提取器 {ie_key} 失败: {e}")
+        ydl.close()
+        timings['extractors'] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    if not _load_curl_cffi():
+        import requests
+    timings['http_client'] = time.perf_counter() - started
+    
+    return timings
 
 
-# 单例实例
-universal_downloader = UniversalDownloader()
+def __getattr__(name: str) -> Any:
+    # 兼容旧代码中的 universal_downloader.universal_downloader
+    if name == 'universal_downloader':
+        return get_downloader()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")